@@ -0,0 +1,62 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Compare the cost of droppy.app() with the dict-based accessor it replaced
+and with a plain attribute read.
+
+    python benchmarks/bench_app_access.py [iterations]
+"""
+import sys
+import timeit
+
+import droppy
+
+
+class Holder(object):
+    pass
+
+
+_LEGACY = {}
+
+
+def legacy_app():
+    # droppy.app() as it was before the module-level reference.
+    if _LEGACY:
+        return _LEGACY.itervalues().next()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    a = object()
+    droppy.set_app(a)
+    _LEGACY[None] = a
+    holder = Holder()
+    holder.app = a
+    cases = [
+        ("attribute read", lambda: holder.app),
+        ("droppy.app()", droppy.app),
+        ("legacy app()", legacy_app),
+        ("wait_for_app()", droppy.wait_for_app),
+    ]
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=n, repeat=3))
+        print("{0:16s} {1:8.1f} ns/call".format(name, best / n * 1e9))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Compare the throughput of the registered server backends serving a tiny
+JSON response. Each backend runs in a forked process; the parent drives it
+over keep-alive connections from a number of client greenlets.
+
+    python benchmarks/bench_backends.py [seconds] [concurrency]
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import sys
+import time
+import signal
+import socket
+
+import gevent
+
+from droppy.server.backends import get_backend, backend_names
+from droppy.server.server import ServerFarm, create_listener
+
+
+class Config(object):
+    maxAccept = 100
+    keepAlive = True
+
+
+def application(environ, start_response):
+    body = '{"status": "ok"}'
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+REQUEST = ("GET / HTTP/1.1\r\nHost: localhost\r\n"
+           "Connection: keep-alive\r\n\r\n")
+
+
+def client(address, deadline, counts):
+    sock = socket.create_connection(address)
+    f = sock.makefile('rb')
+    try:
+        while time.time() < deadline:
+            sock.sendall(REQUEST)
+            length = 0
+            line = f.readline()
+            if not line:
+                return
+            while line not in ('\r\n', ''):
+                if line.lower().startswith('content-length:'):
+                    length = int(line.split(':', 1)[1])
+                line = f.readline()
+            f.read(length)
+            counts.append(1)
+    finally:
+        f.close()
+        sock.close()
+
+
+def bench(name, seconds, concurrency):
+    listener = create_listener(('127.0.0.1', 0), backlog=1024)
+    address = listener.getsockname()
+    pid = gevent.fork()
+    if not pid:
+        farm = ServerFarm()
+        farm.add(get_backend(name)(listener, application, Config()),
+                 size=concurrency)
+        farm.serve_forever()
+        os._exit(0)
+    try:
+        gevent.sleep(0.5)
+        counts = []
+        deadline = time.time() + seconds
+        gevent.joinall([gevent.spawn(client, address, deadline, counts)
+                        for i in xrange(concurrency)])
+        return len(counts) / float(seconds)
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    for name in backend_names():
+        print("{0:10s} {1:10.0f} req/s".format(
+            name, bench(name, seconds, concurrency)))
+
+
+if __name__ == "__main__":
+    main()
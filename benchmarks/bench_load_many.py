@@ -0,0 +1,85 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Compare validating a batch of records one at a time with load() against
+load_many(), in both row and columnar modes.
+
+    python benchmarks/bench_load_many.py [records]
+"""
+import sys
+import timeit
+
+from droppy.validation import ParsedDocument, ParsedProperty, Int, String
+from droppy.validation.properties import _reset_fields
+
+
+class Location(ParsedDocument):
+    @Int()
+    def lat(self):
+        return 0
+
+    @Int()
+    def lon(self):
+        return 0
+
+
+class Event(ParsedDocument):
+    @String()
+    def name(self):
+        return ParsedDocument.NoDefault
+
+    @Int()
+    def count(self):
+        return 1
+
+    @String()
+    def source(self):
+        return "unknown"
+
+    @ParsedProperty
+    def location(self):
+        return Location()
+
+
+def legacy_load(cls, item):
+    # ParsedDocument.load as it was before validation plans.
+    inst = cls()
+    _reset_fields(inst)
+    inst.to_python(item)
+    return inst
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    items = [{'name': 'event%d' % i, 'count': i,
+              'location': {'lat': i % 90, 'lon': i % 180}}
+             for i in xrange(n)]
+    cases = [
+        ("legacy per-item", lambda: [legacy_load(Event, x) for x in items]),
+        ("load() per-item", lambda: [Event.load(x) for x in items]),
+        ("load_many rows", lambda: list(Event.load_many(items))),
+        ("load_many columnar", lambda: Event.load_many(items, columnar=True)),
+    ]
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=3))
+        print("{0:20s} {1:8.1f} ms  {2:8.2f} us/record".format(
+            name, best * 1e3, best / n * 1e6))
+
+
+if __name__ == "__main__":
+    main()
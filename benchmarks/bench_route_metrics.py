@@ -0,0 +1,51 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Measure the per-request overhead of RouteMetricsPlugin by timing a trivial
+handler with and without the plugin applied.
+
+    python benchmarks/bench_route_metrics.py
+"""
+import timeit
+
+import bottle
+
+from droppy.metrics import MetricsRegistry, RouteMetricsPlugin
+
+
+N = 200000
+
+
+def handler():
+    return "ok"
+
+
+def main():
+    bottle.response.bind()
+    route = bottle.Route(bottle.Bottle(), '/items/<id>', 'GET', handler)
+    wrapped = RouteMetricsPlugin(MetricsRegistry()).apply(handler, route)
+
+    bare = min(timeit.repeat(handler, number=N, repeat=5)) / N
+    timed = min(timeit.repeat(wrapped, number=N, repeat=5)) / N
+    print("bare handler:   {0:8.3f} us".format(bare * 1e6))
+    print("with metrics:   {0:8.3f} us".format(timed * 1e6))
+    print("overhead:       {0:8.3f} us/request".format((timed - bare) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
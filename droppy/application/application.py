@@ -15,16 +15,24 @@
 ##  limitations under the License.
 ##
 ###############################################################################
-from gevent import monkey
-monkey.patch_all()
-
+import os
 import sys
+import logging
 import argparse
+from collections import OrderedDict
 from gevent.event import Event
 
 import droppy
-from droppy.server import ServerSubcommand
-from droppy.config import DroppyConfiguration
+from droppy.config import DroppyConfiguration, ConfigurationCache
+from droppy.config import ConfigurationWatcher, load_configuration
+from droppy.metrics import MetricsRegistry
+from droppy.health import HealthCheck, HealthCheckRegistry
+from droppy.validation import FrozenDocument
+from droppy.tasks import TaskQueue
+from .startup import StartupProfile
+
+
+log = logging.getLogger("droppy")
 
 
 class Application(object):
@@ -36,14 +44,23 @@ class Application(object):
         self._name = name
         self._config_class = config_class
         self._subcommands = {}
-        self._setup_parser()
+        self._startup = StartupProfile()
+        self._startup.add("import droppy", droppy._import_time)
+        with self._startup.phase("build parser"):
+            self._setup_parser()
         self._server_started = False
         self._on_server = Event()
         self._on_server.clear()
         self.arguments = None
+        self.metrics = MetricsRegistry()
+        self.health_checks = HealthCheckRegistry()
+        self._config_listeners = []
+        self.resources = OrderedDict()
+        self._tasks = None
 
         self._main_bottle = None
         self._admin_bottle = None
+        self._farm = None
 
         # Set the global instance
         droppy.set_app(self)
@@ -67,26 +84,139 @@ class Application(object):
             raise ValueError("Subcommand {0} has already been registered."
             .format(subcommand.name))
         self._subcommands[subcommand.name] = subcommand
-        subparser = self._subparsers.add_parser(
-            subcommand.name, help=subcommand.description)
-        subparser.set_defaults(subcommand=subcommand)
-        subcommand.configure(subparser)
+        with self._startup.phase("configure " + subcommand.name):
+            subparser = self._subparsers.add_parser(
+                subcommand.name, help=subcommand.description)
+            subparser.set_defaults(subcommand=subcommand)
+            subcommand.configure(subparser)
+
+    def add_health_check(self, name, check):
+        """
+        Register a HealthCheck, to be reported by the admin server's
+        /healthcheck endpoint.
+        """
+        self.health_checks.register(name, check)
+
+    def add_resource(self, name, resource):
+        """
+        Register a Resource, such as a ConnectionPool, under name. The server
+        starts it before serving and closes it on shutdown. Its metrics are
+        published, and if it is a HealthCheck it is checked by the admin
+        server's /healthcheck.
+        """
+        if name in self.resources:
+            raise ValueError("Resource {0} has already been registered."
+                             .format(name))
+        self.resources[name] = resource
+        resource.register_metrics(self.metrics, name)
+        if isinstance(resource, HealthCheck):
+            self.add_health_check(name, resource)
+        return resource
+
+    @property
+    def tasks(self):
+        """
+        The application's TaskQueue, configured by the tasks section of the
+        configuration and managed as the resource named "tasks".
+        """
+        if self._tasks is None:
+            self._tasks = self.add_resource(
+                "tasks", TaskQueue.from_config(self.config.tasks))
+        return self._tasks
+
+    def add_background_task(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) on the application's task queue, off the
+        request path. Returns False if the task was dropped; raises
+        QueueFull if the queue stayed full for too long.
+        """
+        return self.tasks.submit(func, *args, **kwargs)
+
+    def start_resources(self):
+        for resource in self.resources.itervalues():
+            resource.start()
+
+    def close_resources(self):
+        """
+        Close resources in the reverse of the order they were added, but task
+        queues first of all, so that tasks still draining can use the other
+        resources.
+        """
+        resources = list(reversed(self.resources.items()))
+        queues = [(n, r) for n, r in resources if isinstance(r, TaskQueue)]
+        others = [(n, r) for n, r in resources if not isinstance(r, TaskQueue)]
+        for name, resource in queues + others:
+            try:
+                resource.close()
+            except Exception:
+                log.exception("Error closing resource %s", name)
+
+    def add_config_listener(self, listener):
+        """
+        Register listener(old, new) to be called whenever the configuration
+        is replaced while the application is running.
+        """
+        self._config_listeners.append(listener)
+
+    def reload_configuration(self, config):
+        """
+        Make config the current configuration and notify listeners. If the
+        current configuration is frozen, so is the new one.
+        """
+        if isinstance(self.config, FrozenDocument):
+            config = config.freeze()
+        old, self.config = self.config, config
+        for listener in self._config_listeners:
+            try:
+                listener(old, config)
+            except Exception:
+                log.exception("Configuration listener %r failed", listener)
+
+    def watch_configuration(self):
+        """
+        Reload the configuration file whenever it changes. Returns the
+        ConfigurationWatcher, or None if there is no file to watch.
+        """
+        filename = self.arguments.config
+        if filename is None:
+            return None
+        watcher = ConfigurationWatcher(
+            filename, lambda f: load_configuration(self._config_class, f),
+            self.reload_configuration)
+        watcher.start()
+        return watcher
 
     def _setup_parser(self):
         parser = self._parser = argparse.ArgumentParser(
             description=self.__class__.__doc__)
         parser.add_argument('-c', '--config', default=None,
                             help="Path to configuration file")
+        parser.add_argument('--config-cache',
+                            default=os.environ.get('DROPPY_CONFIG_CACHE'),
+                            help="Directory in which to cache validated "
+                                 "configuration between runs")
+        parser.add_argument('--watch-config', action='store_true',
+                            help="Reload the configuration file when it "
+                                 "changes")
+        parser.add_argument('--profile-startup', action='store_true',
+                            help="Report how long each phase of startup "
+                                 "took")
         self._subparsers = parser.add_subparsers(help="Subcommands")
 
     def _load_configuration(self, filename):
         if filename is None:
             self.config = self._config_class.load("")
+        elif self.arguments and self.arguments.config_cache:
+            cache = ConfigurationCache(self.arguments.config_cache)
+            with open(filename, 'r') as f:
+                self.config = cache.load(self._config_class, f.read())
         else:
             with open(filename, 'r') as f:
                 self.config = self._config_class.load(f)
 
     def _add_server_subcommand(self):
+        with self._startup.phase("import server"):
+            from droppy.server import ServerSubcommand
         self.add_subcommand(ServerSubcommand())
 
     @property
@@ -103,6 +233,11 @@ class Application(object):
         self._on_server.wait()
         return self._admin_bottle
 
+    @property
+    def farm(self):
+        self._on_server.wait()
+        return self._farm
+
     def _split_args(self, args):
         droppy, passthrough = [], []
         gen = (x for x in args)
@@ -114,13 +249,32 @@ class Application(object):
         return droppy, passthrough
 
     def run(self):
+        startup = self._startup
         args = list(sys.argv)
-        self.initialize()
+        with startup.phase("initialize"):
+            self.initialize()
         self._add_server_subcommand()
         args, sys.argv[1:] = self._split_args(args)
-        self.arguments = self._parser.parse_args(args[1:])
-        self._load_configuration(self.arguments.config)
-        self.arguments.subcommand.run(self)
+        with startup.phase("parse arguments"):
+            self.arguments = self._parser.parse_args(args[1:])
+        subcommand = self.arguments.subcommand
+        # Only subcommands that serve need gevent's patched stdlib, so
+        # one-off tools don't pay for patching. Nothing droppy has imported
+        # so far uses threading or sockets; the server subcommand imports
+        # bottle and the rest of the server when it runs.
+        if subcommand.patch_gevent:
+            if 'bottle' in sys.modules:
+                log.warning("bottle was imported before gevent patched the "
+                            "standard library, so concurrent requests will "
+                            "share its request and response objects")
+            with startup.phase("patch gevent"):
+                from gevent import monkey
+                monkey.patch_all()
+        with startup.phase("load configuration"):
+            self._load_configuration(self.arguments.config)
+        if self.arguments.profile_startup:
+            startup.report()
+        subcommand.run(self)
 
 
 if __name__ == "__main__":
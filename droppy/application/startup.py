@@ -0,0 +1,62 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Timing of the phases of application startup, reported by
+``--profile-startup``.
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile(object):
+    """
+    Records how long each named phase of startup takes. Phases may nest;
+    nested phases are indented under their parent in the report.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.phases = []
+        self._depth = 0
+
+    def add(self, name, seconds):
+        self.phases.append((self._depth, name, seconds))
+
+    @contextmanager
+    def phase(self, name):
+        index = len(self.phases)
+        self.phases.append(None)
+        self._depth += 1
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.phases[index] = (self._depth, name, self.clock() - start)
+
+    def report(self, stream=None):
+        stream = stream or sys.stderr
+        stream.write("Startup profile:\n")
+        total = 0.0
+        for depth, name, seconds in self.phases:
+            if depth == 0:
+                total += seconds
+            stream.write("  {0:40s} {1:9.1f} ms\n".format(
+                "  " * depth + name, seconds * 1e3))
+        stream.write("  {0:40s} {1:9.1f} ms\n".format("total", total * 1e3))
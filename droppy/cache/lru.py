@@ -0,0 +1,139 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import time
+from collections import OrderedDict
+
+from droppy.concurrency import SingleFlight
+
+
+_MISSING = object()
+
+
+def _sizeof(value):
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+class LRUCache(object):
+    """
+    A bounded in-process cache whose entries expire ttl seconds after they
+    are stored. Once it holds max_size entries, storing another evicts the
+    least recently used one.
+
+    get_or_compute() coalesces concurrent misses: the first greenlet to miss
+    on a key computes the value and every other greenlet asking for the same
+    key meanwhile waits for that result (or exception) instead of computing
+    it again.
+
+    sizeof estimates the memory held by a value, in bytes; by default the
+    len() of values that have one.
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0, sizeof=_sizeof,
+                 clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._flight = SingleFlight()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def coalesced(self):
+        return self._flight.coalesced.count
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def _lookup(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return _MISSING
+        expires, value, size = entry
+        if expires <= self.clock():
+            self.bytes -= size
+            return _MISSING
+        # Re-inserting moves the entry to the most recently used end.
+        self._entries[key] = entry
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        self.invalidate(key)
+        size = self.sizeof(value)
+        self._entries[key] = (self.clock() + ttl, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_size:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def get_or_compute(self, key, func, ttl=None):
+        """
+        Return the cached value for key, calling func() to compute and store
+        it on a miss. If func raises, nothing is stored and the exception
+        propagates to every caller waiting on the key.
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return self._flight.do(key, self._compute, key, func, ttl)
+
+    def _compute(self, key, func, ttl):
+        value = func()
+        self.set(key, value, ttl)
+        return value
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        return {'size': len(self._entries), 'max_size': self.max_size,
+                'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'coalesced': self.coalesced,
+                'evictions': self.evictions, 'hit_ratio': self.hit_ratio()}
@@ -0,0 +1,181 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Response caching for bottle routes.
+
+    @app.get('/reports/<id>')
+    @cached(ttl=30)
+    def report(id):
+        ...
+
+or, with CachePlugin installed, ``@app.get('/reports/<id>', cache_ttl=30)``.
+
+Only successful GET and HEAD responses whose body is a string or a dict
+(rendered as JSON) are cached; anything else is passed through untouched.
+A cached response carries its Content-Type and an ETag, and a request whose
+If-None-Match matches the ETag is answered with a 304. Other headers set by
+the route are not replayed from the cache.
+"""
+import json
+import hashlib
+from functools import wraps
+
+from .lru import LRUCache
+
+
+_CACHES = {}
+_WATCHERS = []
+
+
+def caches():
+    """
+    Return a dict mapping name to LRUCache for every cached route.
+    """
+    return dict(_CACHES)
+
+
+def watch_caches(callback):
+    """
+    Call callback(name) for each route cache, both those that exist and
+    those created later, e.g. when CachePlugin is first applied to a route.
+    A cache created again under the same name replaces the old one and is
+    not reported twice.
+    """
+    _WATCHERS.append(callback)
+    for name in _CACHES.keys():
+        callback(name)
+
+
+def _add_cache(name, cache):
+    new = name not in _CACHES
+    _CACHES[name] = cache
+    if new:
+        for callback in _WATCHERS:
+            callback(name)
+
+
+class _CachedResponse(object):
+    __slots__ = ('body', 'content_type', 'etag')
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+
+    def __len__(self):
+        return len(self.body)
+
+
+class _Uncacheable(Exception):
+    def __init__(self, result):
+        Exception.__init__(self)
+        self.result = result
+
+
+def _default_key(request):
+    return request.path + '?' + request.query_string
+
+
+def _render(result, response):
+    if isinstance(result, dict):
+        return json.dumps(result), 'application/json'
+    if isinstance(result, unicode):
+        return result.encode(response.charset), response.content_type
+    if isinstance(result, str):
+        return result, response.content_type
+    return None, None
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [t.strip() for t in header.split(',')]
+    return etag in tags or 'W/' + etag in tags
+
+
+def cached(ttl=60.0, key=None, max_size=1024, name=None):
+    """
+    Decorate a bottle route so that its responses are kept in an LRUCache
+    of max_size entries for ttl seconds. key is called with the request to
+    compute the cache key; by default it is the path plus query string.
+
+    Concurrent requests that miss on the same key wait for one greenlet to
+    compute the response rather than each computing it. The cache is listed
+    under name (by default the route function's dotted name) by caches().
+    """
+    import bottle
+    request, response = bottle.request, bottle.response
+    keyfunc = key or _default_key
+
+    def decorator(func):
+        cache = LRUCache(max_size, ttl)
+        _add_cache(name or func.__module__ + '.' + func.__name__, cache)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return func(*args, **kwargs)
+            computed = []
+
+            def compute():
+                computed.append(True)
+                result = func(*args, **kwargs)
+                body, content_type = _render(result, response)
+                if body is None or response.status_code != 200:
+                    raise _Uncacheable(result)
+                return _CachedResponse(body, content_type)
+
+            try:
+                entry = cache.get_or_compute(keyfunc(request), compute)
+            except _Uncacheable as e:
+                if computed:
+                    return e.result
+                # Another request's response couldn't be shared; make our
+                # own.
+                return func(*args, **kwargs)
+            if _etag_matches(request.headers.get('If-None-Match'),
+                             entry.etag):
+                return bottle.HTTPResponse(status=304,
+                                           headers={'ETag': entry.etag})
+            response.set_header('ETag', entry.etag)
+            response.content_type = entry.content_type
+            return entry.body
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+class CachePlugin(object):
+    """
+    A bottle plugin that caches routes declared with a cache_ttl option,
+    and optionally cache_key and cache_size, as cached() does.
+    """
+    name = 'droppy.cache'
+    api = 2
+
+    def apply(self, callback, route):
+        config = route.config
+        ttl = config.get('cache_ttl')
+        if ttl is None:
+            return callback
+        return cached(ttl, key=config.get('cache_key'),
+                      max_size=config.get('cache_size', 1024),
+                      name="{0} {1}".format(route.method, route.rule))(callback)
@@ -20,7 +20,12 @@ class Subcommand(object):
     """
     Represents a subcommand that may be executed from the command line.
     You can add custom parser options.
+
+    Set patch_gevent to have the application monkey-patch the standard
+    library with gevent before the subcommand runs.
     """
+    patch_gevent = False
+
     def __init__(self, name, description):
         self.name = name
         self.description = description
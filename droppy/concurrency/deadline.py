@@ -0,0 +1,104 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Deadlines for the current greenlet.
+
+A deadline is an absolute time by which the work a greenlet is doing should
+be finished. Code run within(seconds) has one, enforced with a
+gevent.Timeout, and anything it calls can ask for the time remaining, for
+instance to cap the timeout of an outbound request:
+
+    response = client.get(url, timeout=cap_timeout(5.0))
+
+Deadlines don't pass to new greenlets by themselves; start them with
+spawn_with_deadline() to bound them by the current deadline too.
+"""
+import time
+from contextlib import contextmanager
+
+import gevent
+from gevent.local import local
+
+
+_local = local()
+
+
+def current_deadline():
+    """
+    Return the current greenlet's deadline as a time.time() value, or None.
+    """
+    return getattr(_local, 'deadline', None)
+
+
+def remaining():
+    """
+    Return the number of seconds left until the current deadline, or None
+    if there is no deadline.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0.0)
+
+
+def cap_timeout(timeout):
+    """
+    Return timeout, reduced to the time remaining until the current deadline
+    if that is shorter. A timeout of None means no timeout.
+    """
+    left = remaining()
+    if left is None or (timeout is not None and timeout < left):
+        return timeout
+    return left
+
+
+@contextmanager
+def within(seconds):
+    """
+    Run the block with a deadline seconds from now, or the current deadline
+    if that is sooner. The block is interrupted with the gevent.Timeout
+    yielded by the context manager if it runs past its deadline.
+    """
+    previous = getattr(_local, 'deadline', None)
+    now = time.time()
+    deadline = now + seconds
+    if previous is not None and previous < deadline:
+        deadline = previous
+    _local.deadline = deadline
+    timer = gevent.Timeout(max(deadline - now, 0.0))
+    timer.start()
+    try:
+        yield timer
+    finally:
+        timer.cancel()
+        _local.deadline = previous
+
+
+def _run_until(deadline, func, args, kwargs):
+    with within(deadline - time.time()):
+        return func(*args, **kwargs)
+
+
+def spawn_with_deadline(func, *args, **kwargs):
+    """
+    Like gevent.spawn, but the new greenlet inherits the current deadline.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return gevent.spawn(func, *args, **kwargs)
+    return gevent.spawn(_run_until, deadline, func, args, kwargs)
@@ -0,0 +1,88 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+from gevent.event import AsyncResult
+
+from droppy.metrics import Counter
+
+
+# Tells waiters that the call they were waiting for was interrupted.
+_RETRY = object()
+
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls that share a key. While a call for a key
+    is in flight, every other greenlet calling do() with that key waits for
+    it and gets its result, or its exception, instead of making the call
+    itself. Once the call finishes the key is forgotten, so the next call
+    runs afresh; results are shared, never cached.
+
+        flight = SingleFlight(app.metrics, "users.lookup")
+        user = flight.do(user_id, db.load_user, user_id)
+
+    If registry is given, the calls, coalesced and errors counters are
+    registered in it under name.
+    """
+
+    def __init__(self, registry=None, name="droppy.singleflight"):
+        if registry is None:
+            self.calls, self.coalesced, self.errors = (
+                Counter(), Counter(), Counter())
+        else:
+            self.calls = registry.counter(name + ".calls")
+            self.coalesced = registry.counter(name + ".coalesced")
+            self.errors = registry.counter(name + ".errors")
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, key):
+        return key in self._pending
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Return func(*args, **kwargs), unless a call for key is already in
+        flight, in which case wait for and return its result.
+        """
+        pending = self._pending.get(key)
+        while pending is not None:
+            self.coalesced.count += 1
+            result = pending.get()
+            if result is not _RETRY:
+                return result
+            pending = self._pending.get(key)
+        self.calls.count += 1
+        pending = self._pending[key] = AsyncResult()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.errors.count += 1
+            pending.set_exception(e)
+            raise
+        except BaseException:
+            # GreenletExit, or a gevent.Timeout such as the caller's own
+            # deadline, concerns only this greenlet; let the waiters make
+            # the call themselves instead.
+            pending.set(_RETRY)
+            raise
+        else:
+            pending.set(result)
+            return result
+        finally:
+            del self._pending[key]
@@ -18,19 +18,31 @@
 from formencode import Invalid
 from .exceptions import ConfigurationException
 from .configuration import DroppyConfiguration, Configuration
+from .configuration import ConnectionPoolConfiguration
+from .configuration import HTTPClientConfiguration, SocketPoolConfiguration
+from .cache import ConfigurationCache
+from .watcher import ConfigurationWatcher
 
 
 __all__ = ["ConfigurationException", "DroppyConfiguration",
-           "Configuration", "load_configuration"]
+           "Configuration", "ConfigurationCache", "ConfigurationWatcher",
+           "ConnectionPoolConfiguration", "HTTPClientConfiguration",
+           "SocketPoolConfiguration", "load_configuration"]
 
 
-def load_configuration(klass, filename):
+def load_configuration(klass, filename, cache=None):
+    """
+    Load and validate filename as a klass. If a ConfigurationCache is given,
+    a previously validated copy of the same file is used when possible.
+    """
     if not issubclass(klass, Configuration):
         raise ConfigurationException(
             "Configuration must subclass droppy.config.Configuration")
     try:
         with open(filename, 'r') as config_file:
             try:
+                if cache is not None:
+                    return cache.load(klass, config_file.read())
                 return klass.load(config_file)
             except ValueError:
                 raise ConfigurationException(
@@ -0,0 +1,183 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import os
+import sys
+import stat
+import errno
+import hashlib
+import logging
+import tempfile
+import cPickle as pickle
+
+import formencode
+
+from droppy.validation.properties import ParsedDocument, _plan_for
+
+
+log = logging.getLogger("droppy.config")
+
+
+def _module_file(cls):
+    module = sys.modules.get(cls.__module__)
+    filename = getattr(module, '__file__', None)
+    if filename is None:
+        raise ValueError("{0} has no source file".format(cls))
+    if filename.endswith(('.pyc', '.pyo')):
+        filename = filename[:-1]
+    return filename
+
+
+def _validator_files(validator, files, seen):
+    if id(validator) in seen:
+        return
+    seen.add(id(validator))
+    for cls in type(validator).__mro__:
+        if cls.__module__ != '__builtin__':
+            files.add(_module_file(cls))
+    for v in getattr(validator, 'validators', ()):
+        _validator_files(v, files, seen)
+
+
+def _source_files(klass, files, seen):
+    if klass in seen:
+        return
+    seen.add(klass)
+    for cls in klass.__mro__:
+        if issubclass(cls, ParsedDocument):
+            files.add(_module_file(cls))
+    plan = _plan_for(klass)
+    for validator in (plan.proto.pre_validators +
+                      plan.proto.chained_validators):
+        _validator_files(validator, files, seen)
+    for name, validator, nested, default, accepts in plan.steps:
+        if nested is None:
+            _validator_files(validator, files, seen)
+    for nested in plan.nested.itervalues():
+        _source_files(nested.cls, files, seen)
+
+
+def schema_files(klass):
+    """
+    Return the source files that determine how klass is validated: the
+    modules defining klass, its bases, the document classes nested in it
+    and every validator they use, and droppy's own validation package.
+    """
+    files = set()
+    _source_files(klass, files, set())
+    package = os.path.dirname(_module_file(ParsedDocument))
+    for name in os.listdir(package):
+        if name.endswith('.py'):
+            files.add(os.path.join(package, name))
+    return sorted(files)
+
+
+def schema_fingerprint(klass):
+    """
+    Hash the files returned by schema_files(klass) together with the version
+    of formencode, so that any change to the code validating klass changes
+    the fingerprint. (The formencode modules defining the validators are
+    among the files, for versions of formencode that don't declare one.)
+    """
+    digest = hashlib.sha1(getattr(formencode, '__version__', ''))
+    for filename in schema_files(klass):
+        digest.update(filename)
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class ConfigurationCache(object):
+    """
+    An on-disk cache of validated configurations. Entries are keyed by the
+    configuration class, a hash of the raw file content and a fingerprint of
+    the schema's source code, so a cached configuration is only used when
+    neither the file nor the code that validates it has changed. A hit skips
+    both parsing and validation.
+
+    Entries are pickles, so the directory must only be writable by the user
+    running the service; it is created with mode 0700, and an existing
+    directory owned by another user or writable by group or others is not
+    used at all.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, klass, content):
+        digest = hashlib.sha1()
+        for part in (klass.__module__, klass.__name__, sys.version,
+                     schema_fingerprint(klass),
+                     hashlib.sha1(content).hexdigest()):
+            digest.update(part)
+        return os.path.join(self.directory, "{0}.{1}-{2}.pickle".format(
+            klass.__module__, klass.__name__, digest.hexdigest()))
+
+    def _check_directory(self):
+        try:
+            st = os.stat(self.directory)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        if st.st_uid != os.getuid():
+            raise ValueError("{0} is not owned by the current user".format(
+                self.directory))
+        if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise ValueError("{0} is writable by other users".format(
+                self.directory))
+
+    def load(self, klass, content):
+        """
+        Return klass loaded from content, using the cache if possible.
+        Problems with the cache are logged and otherwise ignored.
+        """
+        try:
+            self._check_directory()
+            path = self._path(klass, content)
+        except (IOError, OSError, ValueError) as e:
+            log.warning("Not caching configuration: %s", e)
+            return klass.load(content)
+
+        plan = _plan_for(klass)
+        try:
+            with open(path, 'rb') as f:
+                return plan.build(pickle.load(f))
+        except IOError:
+            pass
+        except Exception as e:
+            log.warning("Ignoring unreadable configuration cache %s: %s",
+                        path, e)
+
+        values = plan.load(ParsedDocument.parse(content), as_dict=True)
+        try:
+            self._write(path, values)
+        except (IOError, OSError, pickle.PicklingError) as e:
+            log.warning("Unable to write configuration cache %s: %s", path, e)
+        return plan.build(values)
+
+    def _write(self, path, values):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(values, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
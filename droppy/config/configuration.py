@@ -17,6 +17,7 @@
 ###############################################################################
 import logging
 from droppy.validation import ParsedDocument, String, Int, ParsedProperty
+from droppy.validation import Bool, Number, OneOf
 from droppy.validation import DictConverter
 
 
@@ -54,6 +55,13 @@ class ServerConfiguration(Configuration):
         """
         return '127.0.0.1'
 
+    @String()
+    def server(self):
+        """
+        The WSGI server backend to use; see droppy.server.backends.
+        """
+        return 'gevent'
+
     @Int()
     def port(self):
         """
@@ -69,6 +77,135 @@ class ServerConfiguration(Configuration):
         """
         return 55000
 
+    @Int(min=1)
+    def maxConcurrency(self):
+        """
+        The maximum number of requests the main server will handle at once.
+        Further connections wait to be accepted until a slot frees up,
+        unless loadShedding is on.
+        """
+        return 1000
+
+    @Int(min=1)
+    def adminMaxConcurrency(self):
+        """
+        The maximum number of requests the admin server will handle at once.
+        The admin server has its own pool, so it never competes with
+        application traffic.
+        """
+        return 10
+
+    @Int(min=1)
+    def backlog(self):
+        """
+        The length of the queue of connections waiting to be accepted.
+        """
+        return 128
+
+    @Int(min=1)
+    def maxAccept(self):
+        """
+        The most connections a server accepts in one go before yielding to
+        other greenlets. Lower values spread connections more evenly between
+        worker processes.
+        """
+        return 100
+
+    @Bool()
+    def keepAlive(self):
+        """
+        Allow HTTP/1.1 keep-alive connections, with backends that support
+        them.
+        """
+        return True
+
+    @Bool()
+    def requestMetrics(self):
+        """
+        Record request counts, latency and status codes for every route on
+        the main server, published through the admin server's /metrics.
+        """
+        return True
+
+    @Number(min=0)
+    def requestTimeout(self):
+        """
+        Seconds a request to the main server may take before it is
+        interrupted and answered with a 503, or 0 for no limit. Handlers can
+        read the time they have left with droppy.concurrency.remaining().
+        """
+        return 0
+
+    @Int(min=1)
+    def workers(self):
+        """
+        The number of worker processes to fork. With more than one, a master
+        process binds the listening sockets and supervises the workers.
+
+        The workers share the admin port too, so the admin server reports
+        on whichever worker answers; its metrics carry a worker label with
+        that worker's pid, to be aggregated across workers when queried.
+        """
+        return 1
+
+    @Bool()
+    def reusePort(self):
+        """
+        Have each worker bind its own sockets with SO_REUSEPORT instead of
+        sharing sockets bound by the master process.
+        """
+        return False
+
+    @Number(min=0)
+    def shutdownGracePeriod(self):
+        """
+        Seconds that in-flight requests are given to finish when the server
+        is stopped or reloaded, before they are killed.
+        """
+        return 10
+
+    @Bool()
+    def loadShedding(self):
+        """
+        Admit requests to the main server through an admission controller
+        that rejects excess load with a 503 rather than letting connections
+        queue without bound. Takes effect when the server starts.
+        """
+        return False
+
+    @Int(min=0)
+    def maxQueue(self):
+        """
+        With loadShedding, the number of requests that may wait for one of
+        the maxConcurrency slots. Requests beyond that are rejected at once.
+        """
+        return 100
+
+    @Number(min=0)
+    def queueTarget(self):
+        """
+        With loadShedding, seconds a request may wait for a slot once the
+        queue has not drained for a whole queueInterval.
+        """
+        return 0.005
+
+    @Number(min=0)
+    def queueInterval(self):
+        """
+        With loadShedding, seconds a request may wait for a slot while the
+        server is keeping up, and how long the queue must go without
+        draining before waits are cut to queueTarget.
+        """
+        return 0.1
+
+    @Int(min=0)
+    def retryAfter(self):
+        """
+        The Retry-After, in seconds, sent with requests rejected by
+        loadShedding.
+        """
+        return 1
+
 
 class LoggingConfiguration(Configuration):
 
@@ -81,6 +218,202 @@ class LoggingConfiguration(Configuration):
         return logging.INFO
 
 
+class HealthCheckConfiguration(Configuration):
+
+    @Number(min=0)
+    def cacheTtl(self):
+        """
+        Seconds for which health check results are reused before the checks
+        are run again.
+        """
+        return 1
+
+    @Number(min=0)
+    def timeout(self):
+        """
+        Seconds a health check may take before it is reported unhealthy.
+        """
+        return 5
+
+
+class RateLimitConfiguration(Configuration):
+
+    @Bool()
+    def enabled(self):
+        """
+        Limit the rate of requests to the main server. Takes effect when
+        the server starts.
+        """
+        return False
+
+    @OneOf(['ip', 'apiKey', 'route'])
+    def key(self):
+        """
+        What each limit applies to: the client's IP address, the API key
+        sent in apiKeyHeader (falling back to the IP address when there is
+        none), or the route, shared by all clients.
+        """
+        return 'ip'
+
+    @Number(min=0.001)
+    def rate(self):
+        """
+        Requests per second allowed for each key, sustained.
+        """
+        return 10
+
+    @Int(min=1)
+    def burst(self):
+        """
+        Requests a key may make at once after being idle.
+        """
+        return 20
+
+    @String()
+    def apiKeyHeader(self):
+        return 'X-Api-Key'
+
+    @Int(min=0)
+    def trustedProxies(self):
+        """
+        The number of proxies in front of the server that append to
+        X-Forwarded-For. The client's IP address is taken from the entry the
+        outermost of them added; with 0, the header is ignored.
+        """
+        return 0
+
+    @Int(min=1)
+    def maxClients(self):
+        """
+        The number of keys tracked. Idle keys are evicted to make room, so
+        memory stays bounded however many clients there are.
+        """
+        return 100000
+
+    @Bool()
+    def shared(self):
+        """
+        Keep the limits in memory shared by all worker processes, so that
+        they hold across prefork workers rather than per worker.
+        """
+        return False
+
+
+class ConnectionPoolConfiguration(Configuration):
+    """
+    Settings for a droppy.resources.ConnectionPool. Declare a section of
+    this type, or of one of its subclasses, for each pool an application
+    uses.
+    """
+
+    @Int(min=1)
+    def maxSize(self):
+        """
+        The most connections the pool keeps open at once.
+        """
+        return 10
+
+    @Number(min=0)
+    def idleTimeout(self):
+        """
+        Seconds after which an unused connection is closed, or 0 to keep
+        connections open indefinitely.
+        """
+        return 60
+
+    @Number(min=0)
+    def connectTimeout(self):
+        return 5
+
+    @Number(min=0)
+    def acquireTimeout(self):
+        """
+        Seconds to wait for a free connection when all are in use.
+        """
+        return 5
+
+
+class HTTPClientConfiguration(ConnectionPoolConfiguration):
+
+    @String()
+    def url(self):
+        """
+        The scheme, host and port of the server to connect to.
+        """
+        return 'http://127.0.0.1:80'
+
+    @String()
+    def healthPath(self):
+        """
+        A path to send HEAD requests to when health checking the server. By
+        default, being able to connect is healthy enough.
+        """
+        return ''
+
+
+class SocketPoolConfiguration(ConnectionPoolConfiguration):
+
+    @String()
+    def host(self):
+        return '127.0.0.1'
+
+    @Int()
+    def port(self):
+        return 6379
+
+
+class TaskQueueConfiguration(Configuration):
+
+    @Int(min=1)
+    def size(self):
+        """
+        The most tasks that may wait in the queue.
+        """
+        return 1000
+
+    @Int(min=1)
+    def concurrency(self):
+        """
+        The number of tasks run at once.
+        """
+        return 4
+
+    @OneOf(['block', 'drop', 'dropOldest'])
+    def overflow(self):
+        """
+        What to do with a task submitted while the queue is full: wait for
+        room for up to blockTimeout seconds, drop it, or drop the oldest
+        queued task to make room for it.
+        """
+        return 'block'
+
+    @Number(min=0)
+    def blockTimeout(self):
+        return 1
+
+    @Int(min=0)
+    def retries(self):
+        """
+        How many times a failing task is retried.
+        """
+        return 0
+
+    @Number(min=0)
+    def retryDelay(self):
+        """
+        Seconds before a failed task is first retried; the delay doubles
+        with each further retry.
+        """
+        return 1
+
+    @Number(min=0)
+    def drainTimeout(self):
+        """
+        Seconds queued tasks are given to finish when the server stops.
+        """
+        return 10
+
+
 class DroppyConfiguration(Configuration):
 
     @ParsedProperty
@@ -91,6 +424,18 @@ class DroppyConfiguration(Configuration):
     def logging(self):
         return LoggingConfiguration()
 
+    @ParsedProperty
+    def health(self):
+        return HealthCheckConfiguration()
+
+    @ParsedProperty
+    def rateLimit(self):
+        return RateLimitConfiguration()
+
+    @ParsedProperty
+    def tasks(self):
+        return TaskQueueConfiguration()
+
 
 
 
@@ -0,0 +1,102 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import os
+import logging
+
+import gevent
+
+
+log = logging.getLogger("droppy.config")
+
+
+class ConfigurationWatcher(object):
+    """
+    Watches a configuration file and, when it changes, loads it again with
+    load(filename) and passes the result to on_change(config). If loading
+    fails, for example because the new file doesn't validate, the error is
+    logged and on_change is not called, so the current configuration stays
+    in place.
+
+    Changes are detected with a libev stat watcher, which uses inotify where
+    the platform supports it and polls every interval seconds otherwise.
+    Bursts of changes, as editors tend to make, are coalesced into a single
+    reload.
+    """
+    debounce = 0.5
+
+    def __init__(self, filename, load, on_change, interval=2.0):
+        self.filename = filename
+        self.load = load
+        self.on_change = on_change
+        self.interval = interval
+        self._watcher = None
+        self._poller = None
+        self._pending = None
+
+    def start(self):
+        loop = gevent.get_hub().loop
+        if hasattr(loop, 'stat'):
+            self._watcher = loop.stat(self.filename, self.interval)
+            self._watcher.start(self._changed)
+        else:
+            self._poller = gevent.spawn(self._poll)
+        log.info("Watching %s for changes", self.filename)
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        for greenlet in (self._poller, self._pending):
+            if greenlet is not None:
+                greenlet.kill(block=False)
+        self._poller = self._pending = None
+
+    def _signature(self):
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime
+
+    def _poll(self):
+        last = self._signature()
+        while True:
+            gevent.sleep(self.interval)
+            signature = self._signature()
+            if signature != last:
+                last = signature
+                self._changed()
+
+    def _changed(self):
+        if self._pending is None:
+            self._pending = gevent.spawn_later(self.debounce, self.reload)
+
+    def reload(self):
+        """
+        Load the file and hand it to on_change. Returns whether it loaded.
+        """
+        self._pending = None
+        try:
+            config = self.load(self.filename)
+        except Exception as e:
+            log.error("Keeping the current configuration; %s failed to "
+                      "load: %s", self.filename, e)
+            return False
+        log.info("Reloaded configuration from %s", self.filename)
+        self.on_change(config)
+        return True
@@ -0,0 +1,150 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import time
+import logging
+
+import gevent
+from gevent.pool import Group
+
+
+log = logging.getLogger("droppy.health")
+
+
+class Result(object):
+    """
+    The outcome of a single health check.
+    """
+
+    def __init__(self, healthy, message=None):
+        self.healthy = healthy
+        self.message = message
+
+    @classmethod
+    def ok(cls, message=None):
+        return cls(True, message)
+
+    @classmethod
+    def failed(cls, message):
+        return cls(False, message)
+
+    def to_dict(self):
+        d = {'healthy': self.healthy}
+        if self.message is not None:
+            d['message'] = self.message
+        return d
+
+
+class HealthCheck(object):
+    """
+    Base class for health checks. Implement check(), returning a Result, or
+    None if everything is fine. Raising an exception marks the check
+    unhealthy. Set timeout to override the default time a check is allowed
+    to take.
+    """
+    timeout = None
+
+    def check(self):
+        raise NotImplementedError
+
+    def execute(self, default_timeout=None):
+        timeout = self.timeout if self.timeout is not None else default_timeout
+        timer = gevent.Timeout(timeout)
+        timer.start()
+        try:
+            result = self.check()
+        except gevent.Timeout as t:
+            # Only our own timeout fails the check; one set by the caller
+            # has to reach the caller.
+            if t is not timer:
+                raise
+            return Result.failed("Timed out after {0}s".format(timeout))
+        except Exception as e:
+            log.exception("Health check %r raised", self)
+            return Result.failed("{0}: {1}".format(e.__class__.__name__, e))
+        finally:
+            timer.cancel()
+        if result is None:
+            return Result.ok()
+        return result
+
+
+class HealthCheckRegistry(object):
+    """
+    Runs registered health checks concurrently, each in its own greenlet
+    with its own timeout, and caches the results for ttl seconds. Callers
+    arriving while the checks are already running wait for that run instead
+    of starting another.
+    """
+
+    def __init__(self, ttl=1.0, timeout=5.0, clock=time.time):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._clock = clock
+        self._checks = {}
+        self._results = None
+        self._expires = 0
+        self._running = None
+
+    def register(self, name, check):
+        if name in self._checks:
+            raise ValueError("Health check {0} has already been registered."
+                             .format(name))
+        self._checks[name] = check
+        self._expires = 0
+
+    def unregister(self, name):
+        self._checks.pop(name, None)
+        self._expires = 0
+
+    @property
+    def names(self):
+        return sorted(self._checks)
+
+    def run_checks(self):
+        """
+        Return a dict mapping check name to Result.
+        """
+        if self._results is not None and self._clock() < self._expires:
+            return self._results
+        if self._running is None:
+            self._running = gevent.spawn(self._run_checks)
+        running = self._running
+        running.join()
+        return running.value
+
+    def _run_checks(self):
+        try:
+            checks = self._checks.items()
+            group = Group()
+            greenlets = [(name, group.spawn(check.execute, self.timeout))
+                         for name, check in checks]
+            group.join()
+            results = {}
+            for name, greenlet in greenlets:
+                result = greenlet.value
+                if not isinstance(result, Result):
+                    result = Result.failed("Check did not complete")
+                results[name] = result
+            self._results = results
+            self._expires = self._clock() + self.ttl
+            return results
+        finally:
+            self._running = None
+
+    def is_healthy(self):
+        return all(r.healthy for r in self.run_checks().itervalues())
@@ -0,0 +1,26 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+from .core import Counter, Gauge, Meter, Histogram, Timer, Snapshot
+from .registry import MetricsRegistry
+from .formatting import to_dict, to_prometheus
+from .routes import RouteMetricsPlugin
+
+
+__all__ = ["Counter", "Gauge", "Meter", "Histogram", "Timer", "Snapshot",
+           "MetricsRegistry", "to_dict", "to_prometheus",
+           "RouteMetricsPlugin"]
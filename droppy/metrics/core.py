@@ -0,0 +1,311 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Metric types.
+
+Metrics are updated from request greenlets without any locking. Greenlets
+only switch when they block, and none of these updates block, so every
+update is atomic within a process.
+"""
+import math
+import time
+import heapq
+import random
+from contextlib import contextmanager
+
+
+class Counter(object):
+    """
+    A value that can be incremented and decremented.
+    """
+    kind = 'counter'
+
+    def __init__(self):
+        self.count = 0
+
+    def inc(self, n=1):
+        self.count += n
+
+    def dec(self, n=1):
+        self.count -= n
+
+    def value(self):
+        return self.count
+
+
+class Gauge(object):
+    """
+    An instantaneous value. Either set it explicitly, or pass a function that
+    is called each time the gauge is read.
+    """
+    kind = 'gauge'
+
+    def __init__(self, func=None):
+        self._func = func
+        self._value = None
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        if self._func is not None:
+            return self._func()
+        return self._value
+
+
+class _EWMA(object):
+    """
+    An exponentially-weighted moving average of a rate, updated every
+    TICK_INTERVAL seconds, as used for UNIX load averages.
+    """
+    TICK_INTERVAL = 5.0
+
+    def __init__(self, minutes):
+        self.alpha = 1 - math.exp(-self.TICK_INTERVAL / 60.0 / minutes)
+        self.rate = None
+
+    def tick(self, count):
+        instant = count / self.TICK_INTERVAL
+        if self.rate is None:
+            self.rate = instant
+        else:
+            self.rate += self.alpha * (instant - self.rate)
+
+
+class Meter(object):
+    """
+    Measures the rate of events: the mean rate since creation, and 1-, 5- and
+    15-minute moving averages.
+    """
+    kind = 'meter'
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self.count = 0
+        self._uncounted = 0
+        self._start = clock()
+        self._next_tick = self._start + _EWMA.TICK_INTERVAL
+        self._averages = (_EWMA(1), _EWMA(5), _EWMA(15))
+
+    def mark(self, n=1):
+        if self._clock() >= self._next_tick:
+            self._tick()
+        self.count += n
+        self._uncounted += n
+
+    def _tick(self):
+        now = self._clock()
+        ticks = int((now - self._next_tick) // _EWMA.TICK_INTERVAL) + 1
+        if ticks <= 0:
+            return
+        self._next_tick += ticks * _EWMA.TICK_INTERVAL
+        uncounted, self._uncounted = self._uncounted, 0
+        for average in self._averages:
+            average.tick(uncounted)
+            # An hour of idle ticks is enough to decay every average to 0.
+            for i in xrange(min(ticks, 720) - 1):
+                average.tick(0)
+
+    def _rate(self, i):
+        self._tick()
+        return self._averages[i].rate or 0.0
+
+    @property
+    def mean_rate(self):
+        elapsed = self._clock() - self._start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def m1_rate(self):
+        return self._rate(0)
+
+    @property
+    def m5_rate(self):
+        return self._rate(1)
+
+    @property
+    def m15_rate(self):
+        return self._rate(2)
+
+    def value(self):
+        return {
+            'count': self.count,
+            'mean_rate': self.mean_rate,
+            'm1_rate': self.m1_rate,
+            'm5_rate': self.m5_rate,
+            'm15_rate': self.m15_rate,
+        }
+
+
+class Snapshot(object):
+    """
+    A sorted, point-in-time copy of a histogram's sampled values.
+    """
+
+    def __init__(self, values):
+        self.values = sorted(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def percentile(self, q):
+        """
+        Return the value at quantile q (0 <= q <= 1), interpolating between
+        samples.
+        """
+        values = self.values
+        if not values:
+            return 0.0
+        pos = q * (len(values) + 1)
+        if pos < 1:
+            return values[0]
+        if pos >= len(values):
+            return values[-1]
+        lower = values[int(pos) - 1]
+        upper = values[int(pos)]
+        return lower + (pos - math.floor(pos)) * (upper - lower)
+
+    @property
+    def median(self):
+        return self.percentile(0.5)
+
+    @property
+    def mean(self):
+        if not self.values:
+            return 0.0
+        return float(sum(self.values)) / len(self.values)
+
+    @property
+    def stddev(self):
+        n = len(self.values)
+        if n < 2:
+            return 0.0
+        mean = self.mean
+        return math.sqrt(sum((v - mean) ** 2 for v in self.values) / (n - 1))
+
+
+class Histogram(object):
+    """
+    The distribution of a stream of values. Count, sum, min and max are
+    exact; quantiles are estimated from a sample of at most size values, so
+    memory use is bounded no matter how many values are recorded.
+
+    The sample is forward-decaying (Cormode et al.): each value is kept
+    with a priority that grows exponentially with the time it was recorded,
+    at rate alpha, so that the sample represents roughly the last
+    5 / alpha seconds (five minutes, by default) and quantiles follow
+    changes in the distribution instead of averaging over the whole life
+    of the process.
+    """
+    kind = 'histogram'
+
+    QUANTILES = (0.5, 0.75, 0.95, 0.98, 0.99, 0.999)
+
+    # Priorities are kept relative to a landmark time, moved forward this
+    # often so that they don't overflow.
+    RESCALE_INTERVAL = 3600.0
+
+    def __init__(self, size=1028, alpha=0.015, clock=time.time):
+        self.size = size
+        self.alpha = alpha
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self._clock = clock
+        self._landmark = clock()
+        self._heap = []
+
+    def update(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        now = self._clock()
+        if now - self._landmark >= self.RESCALE_INTERVAL:
+            self._rescale(now)
+        priority = (math.exp(self.alpha * (now - self._landmark)) /
+                    (1.0 - random.random()))
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, (priority, value))
+        elif priority > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (priority, value))
+
+    def _rescale(self, now):
+        factor = math.exp(-self.alpha * (now - self._landmark))
+        self._landmark = now
+        self._heap = [(p * factor, v) for p, v in self._heap]
+        heapq.heapify(self._heap)
+
+    def snapshot(self):
+        return Snapshot(v for _, v in self._heap)
+
+    def value(self):
+        snapshot = self.snapshot()
+        result = {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min or 0,
+            'max': self.max or 0,
+            'mean': snapshot.mean,
+            'stddev': snapshot.stddev,
+        }
+        for q in self.QUANTILES:
+            result['p{0:g}'.format(q * 100)] = snapshot.percentile(q)
+        return result
+
+
+class Timer(object):
+    """
+    A histogram of durations, in seconds, together with a meter of how often
+    the timed event happens.
+    """
+    kind = 'timer'
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self.histogram = Histogram(clock=clock)
+        self.meter = Meter(clock)
+
+    @property
+    def count(self):
+        return self.histogram.count
+
+    def update(self, seconds):
+        self.histogram.update(seconds)
+        self.meter.mark()
+
+    @contextmanager
+    def time(self):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.update(self._clock() - start)
+
+    def snapshot(self):
+        return self.histogram.snapshot()
+
+    def value(self):
+        result = self.histogram.value()
+        rates = self.meter.value()
+        del rates['count']
+        result.update(rates)
+        return result
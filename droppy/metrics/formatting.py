@@ -0,0 +1,94 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import re
+
+from .registry import format_name
+
+
+def to_dict(registry):
+    """
+    Render every metric in the registry as a JSON-serializable dict.
+    """
+    return dict((format_name(name, labels), metric.value())
+                for name, labels, metric in registry)
+
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+
+
+def _prometheus_name(name):
+    return _INVALID_NAME_CHARS.sub('_', name)
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for k, v in sorted(labels.iteritems()):
+        v = str(v).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+        escaped.append('{0}="{1}"'.format(_prometheus_name(k), v))
+    return '{' + ','.join(escaped) + '}'
+
+
+def _prometheus_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def to_prometheus(registry):
+    """
+    Render every metric in the registry in the Prometheus text exposition
+    format. Counters and gauges become gauges, meters a counter plus a gauge
+    of moving-average rates, and histograms and timers summaries.
+    """
+    families = {}
+
+    def sample(family, kind, labels, value, suffix=''):
+        if not isinstance(value, (int, long, float)) or isinstance(value, bool):
+            return
+        lines = families.setdefault(family, (kind, []))[1]
+        lines.append('{0}{1}{2} {3}'.format(
+            family, suffix, _prometheus_labels(labels),
+            _prometheus_value(value)))
+
+    for name, labels, metric in registry:
+        name = _prometheus_name(name)
+        if metric.kind in ('counter', 'gauge'):
+            sample(name, 'gauge', labels, metric.value())
+        elif metric.kind == 'meter':
+            sample(name + '_total', 'counter', labels, metric.count)
+            for window, rate in (('1m', metric.m1_rate), ('5m', metric.m5_rate),
+                                 ('15m', metric.m15_rate)):
+                sample(name + '_rate', 'gauge',
+                       dict(labels, window=window), rate)
+        elif metric.kind in ('histogram', 'timer'):
+            snapshot = metric.snapshot()
+            histogram = getattr(metric, 'histogram', metric)
+            for q in histogram.QUANTILES:
+                sample(name, 'summary', dict(labels, quantile=repr(q)),
+                       snapshot.percentile(q))
+            sample(name, 'summary', labels, histogram.sum, '_sum')
+            sample(name, 'summary', labels, histogram.count, '_count')
+
+    output = []
+    for family, (kind, lines) in sorted(families.iteritems()):
+        output.append('# TYPE {0} {1}'.format(family, kind))
+        output.extend(lines)
+    output.append('')
+    return '\n'.join(output)
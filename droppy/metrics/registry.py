@@ -0,0 +1,98 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+from .core import Counter, Gauge, Meter, Histogram, Timer
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.iteritems()))
+
+
+class MetricsRegistry(object):
+    """
+    A collection of named metrics. Each metric is identified by a dotted name
+    plus an optional set of labels, e.g.:
+
+        app.metrics.counter("jobs.failed", queue="email").inc()
+
+    Asking for a metric that already exists returns the existing one.
+
+    labels are added to every metric when it is read out, e.g. the worker
+    process a metric belongs to.
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self._metrics = {}
+
+    def register(self, name, metric, **labels):
+        key = _key(name, labels)
+        if key in self._metrics:
+            raise ValueError("A metric named {0} is already registered."
+                             .format(format_name(name, key[1])))
+        self._metrics[key] = metric
+        return metric
+
+    def remove(self, name, **labels):
+        self._metrics.pop(_key(name, labels), None)
+
+    def get(self, name, **labels):
+        return self._metrics.get(_key(name, labels))
+
+    def _get_or_create(self, cls, name, labels, *args):
+        key = _key(name, labels)
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = self._metrics[key] = cls(*args)
+        elif not isinstance(metric, cls):
+            raise ValueError("{0} is a {1}, not a {2}.".format(
+                format_name(name, key[1]), metric.kind, cls.kind))
+        return metric
+
+    def counter(self, name, **labels):
+        return self._get_or_create(Counter, name, labels)
+
+    def gauge(self, name, func=None, **labels):
+        return self._get_or_create(Gauge, name, labels, func)
+
+    def meter(self, name, **labels):
+        return self._get_or_create(Meter, name, labels)
+
+    def histogram(self, name, **labels):
+        return self._get_or_create(Histogram, name, labels)
+
+    def timer(self, name, **labels):
+        return self._get_or_create(Timer, name, labels)
+
+    def __len__(self):
+        return len(self._metrics)
+
+    def __iter__(self):
+        """
+        Yield (name, labels, metric) for every metric, sorted by name.
+        """
+        for (name, labels), metric in sorted(self._metrics.iteritems()):
+            yield name, dict(self.labels, **dict(labels)), metric
+
+
+def format_name(name, labels):
+    if not labels:
+        return name
+    if isinstance(labels, dict):
+        labels = sorted(labels.iteritems())
+    return "{0}{{{1}}}".format(
+        name, ','.join('{0}={1}'.format(k, v) for k, v in labels))
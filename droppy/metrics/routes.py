@@ -0,0 +1,74 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import time
+
+
+class RouteMetricsPlugin(object):
+    """
+    A bottle plugin that records, for each route, how many requests are in
+    flight, a timer of request latency and a count of responses by status
+    code. Metrics are labelled with the route's method and rule rather than
+    the requested URL, so the number of metrics stays bounded.
+
+    All metric objects are looked up once, when bottle applies the plugin to
+    a route, so the per-request cost is a handful of attribute updates.
+    """
+    name = 'droppy.metrics'
+    api = 2
+
+    def __init__(self, registry, prefix="droppy.requests"):
+        self.registry = registry
+        self.prefix = prefix
+
+    def apply(self, callback, route):
+        import bottle
+        registry, prefix = self.registry, self.prefix
+        labels = {'method': route.method, 'route': route.rule}
+        active = registry.counter(prefix + ".active", **labels)
+        timer = registry.timer(prefix + ".latency", **labels)
+        responses = {}
+        response = bottle.response
+        clock = time.time
+
+        def count_response(status):
+            counter = responses.get(status)
+            if counter is None:
+                counter = responses[status] = registry.counter(
+                    prefix + ".responses", status=status, **labels)
+            counter.count += 1
+
+        def wrapper(*args, **kwargs):
+            active.count += 1
+            start = clock()
+            status = 500
+            try:
+                result = callback(*args, **kwargs)
+                if isinstance(result, bottle.HTTPResponse):
+                    status = result.status_code
+                else:
+                    status = response.status_code
+                return result
+            except bottle.HTTPResponse as e:
+                status = e.status_code
+                raise
+            finally:
+                timer.update(clock() - start)
+                active.count -= 1
+                count_response(status)
+
+        return wrapper
@@ -0,0 +1,182 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Token bucket tables.
+
+Buckets are kept in the GCRA form: rather than a token count and a refill
+time, each key stores a single float, the time at which its bucket will
+next be full. Refill is implicit in comparing that time with the clock,
+and a key whose bucket is full is indistinguishable from one that was
+never seen, so idle keys can be evicted at any time without changing any
+decision.
+"""
+import mmap
+import time
+import heapq
+import struct
+import logging
+import multiprocessing
+
+import gevent
+
+
+log = logging.getLogger("droppy.ratelimit")
+
+
+class BucketTable(object):
+    """
+    Token buckets allowing rate requests per second, in bursts of up to
+    burst, for at most max_keys keys held in this process.
+    """
+    EVICT_TO = 0.9
+
+    def __init__(self, rate, burst, max_keys=100000, clock=time.time):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._full_at = {}
+
+    def __len__(self):
+        return len(self._full_at)
+
+    def consume(self, key):
+        """
+        Take a token from key's bucket. Returns 0 if one was available, or
+        else the number of seconds until one will be.
+        """
+        now = self.clock()
+        full_at = self._full_at.get(key, now)
+        if full_at < now:
+            full_at = now
+        full_at += self.interval
+        wait = full_at - now - self.tolerance
+        if wait > 0:
+            return wait
+        self._full_at[key] = full_at
+        if len(self._full_at) > self.max_keys:
+            self._evict(now)
+        return 0
+
+    def _evict(self, now):
+        # Evict down to EVICT_TO of max_keys, so that a full table is only
+        # scanned once every few thousand inserts rather than on every one.
+        full_at = self._full_at
+        for key in [k for k, t in full_at.iteritems() if t <= now]:
+            del full_at[key]
+        # The rest are active: give up the ones closest to being full.
+        excess = len(full_at) - int(self.max_keys * self.EVICT_TO)
+        if excess > 0:
+            for key in heapq.nsmallest(excess, full_at, key=full_at.get):
+                del full_at[key]
+
+
+class SharedBucketTable(object):
+    """
+    Token buckets kept in an anonymous shared memory map, so that a table
+    created before forking is shared by all the worker processes.
+
+    The map is an open-addressed hash table of max_keys slots, each holding
+    a key's hash and the time its bucket is next full. Colliding keys probe
+    a few neighbouring slots; when none is free, the slot whose bucket is
+    closest to full is taken over.
+
+    The lock guarding the map is polled, yielding to other greenlets in
+    between, rather than waited on, which would stall the whole process.
+    If it can't be taken within lock_timeout seconds, perhaps because a
+    worker died holding it, this process limits on a BucketTable of its
+    own for retry_after seconds and then tries the shared table again.
+    """
+    SLOT = struct.Struct('<qd')
+    PROBES = 8
+
+    def __init__(self, rate, burst, max_keys=100000, clock=time.time,
+                 lock_timeout=0.05, retry_after=1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.lock_timeout = lock_timeout
+        self.retry_after = retry_after
+        self._map = mmap.mmap(-1, max_keys * self.SLOT.size)
+        self._lock = multiprocessing.Lock()
+        self._local = None
+        self._local_until = 0
+        self._args = rate, burst, max_keys, clock
+
+    def _acquire(self):
+        # Wall time rather than self.clock, which only has to suit buckets.
+        deadline = time.time() + self.lock_timeout
+        delay = 0.0005
+        while not self._lock.acquire(False):
+            if time.time() >= deadline:
+                return False
+            gevent.sleep(delay)
+            delay = min(delay * 2, 0.005)
+        return True
+
+    def _find(self, h, now):
+        slot, unpack_from = self.SLOT, self.SLOT.unpack_from
+        victim, victim_full_at = None, None
+        for i in xrange(self.PROBES):
+            offset = ((h + i) % self.max_keys) * slot.size
+            slot_hash, full_at = unpack_from(self._map, offset)
+            if slot_hash == h:
+                return offset, full_at
+            if slot_hash == 0 or full_at <= now:
+                return offset, now
+            if victim is None or full_at < victim_full_at:
+                victim, victim_full_at = offset, full_at
+        return victim, now
+
+    def consume(self, key):
+        """
+        Take a token from key's bucket. Returns 0 if one was available, or
+        else the number of seconds until one will be.
+        """
+        if self._local is not None and time.time() < self._local_until:
+            return self._local.consume(key)
+        # 0 marks an empty slot.
+        h = hash(key) or 1
+        if not self._acquire():
+            if self._local is None:
+                log.error("Timed out waiting for the shared rate limit "
+                          "table; limiting this process on its own")
+                self._local = BucketTable(*self._args)
+            self._local_until = time.time() + self.retry_after
+            return self._local.consume(key)
+        if self._local is not None:
+            log.info("Using the shared rate limit table again")
+            self._local = None
+        try:
+            now = self.clock()
+            offset, full_at = self._find(h, now)
+            if full_at < now:
+                full_at = now
+            full_at += self.interval
+            wait = full_at - now - self.tolerance
+            if wait > 0:
+                return wait
+            self.SLOT.pack_into(self._map, offset, h, full_at)
+            return 0
+        finally:
+            self._lock.release()
@@ -0,0 +1,83 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import math
+
+from droppy.metrics import Counter
+from .buckets import BucketTable, SharedBucketTable
+
+
+class RateLimitPlugin(object):
+    """
+    A bottle plugin that rejects requests with a 429 once their key has
+    used up its token bucket. config is a RateLimitConfiguration.
+
+    A route can opt out with ``rate_limit=False`` in its route config.
+    """
+    name = 'droppy.ratelimit'
+    api = 2
+
+    def __init__(self, config):
+        self.config = config
+        table_class = SharedBucketTable if config.shared else BucketTable
+        self.table = table_class(config.rate, config.burst, config.maxClients)
+        self.rejected = Counter()
+
+    def _key_function(self, route):
+        import bottle
+        request = bottle.request
+        config = self.config
+        if config.key == 'route':
+            key = "{0} {1}".format(route.method, route.rule)
+            return lambda: key
+
+        hops = config.trustedProxies
+        if hops:
+            def ip():
+                forwarded = request.environ.get('HTTP_X_FORWARDED_FOR')
+                if forwarded:
+                    # Each proxy appends the address it was connected from,
+                    # so only the last hops entries can be trusted; anything
+                    # further left came from the client.
+                    entries = forwarded.split(',')
+                    return entries[-min(hops, len(entries))].strip()
+                return request.environ.get('REMOTE_ADDR')
+        else:
+            ip = lambda: request.environ.get('REMOTE_ADDR')
+
+        if config.key == 'apiKey':
+            header = 'HTTP_' + config.apiKeyHeader.upper().replace('-', '_')
+            return lambda: request.environ.get(header) or ip()
+        return ip
+
+    def apply(self, callback, route):
+        import bottle
+        if route.config.get('rate_limit') is False:
+            return callback
+        key = self._key_function(route)
+        consume, rejected = self.table.consume, self.rejected
+
+        def wrapper(*args, **kwargs):
+            wait = consume(key())
+            if wait:
+                rejected.count += 1
+                raise bottle.HTTPResponse(
+                    "Too Many Requests\n", status=429,
+                    headers={'Retry-After': str(int(math.ceil(wait)))})
+            return callback(*args, **kwargs)
+
+        return wrapper
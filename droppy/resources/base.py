@@ -0,0 +1,36 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+class Resource(object):
+    """
+    Something long-lived that an application's handlers share, such as a
+    pool of connections to a backend. Register resources with
+    Application.add_resource(); the server starts them in each worker before
+    it begins serving and closes them once it has stopped.
+    """
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+    def register_metrics(self, registry, name):
+        """
+        Register this resource's metrics in registry, labelled with name.
+        """
+        pass
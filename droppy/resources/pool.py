@@ -0,0 +1,331 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import time
+import socket
+import logging
+import httplib
+import urlparse
+from contextlib import contextmanager
+
+import gevent
+try:
+    from gevent.lock import BoundedSemaphore
+except ImportError:
+    from gevent.coros import BoundedSemaphore
+
+from droppy.health import HealthCheck, Result
+from droppy.concurrency import cap_timeout
+from .base import Resource
+
+
+log = logging.getLogger("droppy.resources")
+
+
+class PoolExhausted(Exception):
+    """
+    Raised when no connection becomes free within a pool's acquire timeout.
+    """
+
+
+class ConnectionPool(Resource, HealthCheck):
+    """
+    A bounded pool of connections made by calling connect().
+
+    At most max_size connections are open at once; acquiring beyond that
+    waits up to acquire_timeout seconds for one to be released. Free
+    connections are reused most recently released first, so that under
+    light load the surplus goes unused and is closed by the reaper once it
+    has been idle for idle_timeout seconds.
+
+    close_connection(conn) closes a connection (by default, conn.close()),
+    and probe(conn), if given, is run by check() on a new connection to
+    report the backend's health; it should raise or return False if the
+    connection doesn't work.
+    """
+
+    def __init__(self, connect, max_size=10, idle_timeout=60.0,
+                 acquire_timeout=5.0, close_connection=None, probe=None,
+                 clock=time.time):
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.close_connection = close_connection or (lambda conn: conn.close())
+        self.probe = probe
+        self.clock = clock
+        self.open = 0
+        self.created = 0
+        self.timeouts = 0
+        self.closed = False
+        self._idle = []
+        self._slots = BoundedSemaphore(max_size)
+        self._reaper = None
+
+    @classmethod
+    def from_config(cls, config, *args, **kwargs):
+        """
+        Make a pool sized by a ConnectionPoolConfiguration section.
+        """
+        kwargs.setdefault('max_size', config.maxSize)
+        kwargs.setdefault('idle_timeout', config.idleTimeout)
+        kwargs.setdefault('acquire_timeout', config.acquireTimeout)
+        return cls(*args, **kwargs)
+
+    @property
+    def in_use(self):
+        return self.open - len(self._idle)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def start(self):
+        self.closed = False
+        if self.idle_timeout and self._reaper is None:
+            self._reaper = gevent.spawn(self._reap_forever)
+
+    def close(self):
+        """
+        Close the idle connections and stop pooling; connections in use are
+        closed as they are released.
+        """
+        self.closed = True
+        if self._reaper is not None:
+            self._reaper.kill()
+            self._reaper = None
+        while self._idle:
+            self._close(self._idle.pop()[1])
+
+    def _close(self, conn):
+        self.open -= 1
+        try:
+            self.close_connection(conn)
+        except Exception:
+            log.exception("Error closing connection %r", conn)
+
+    def _reap_forever(self):
+        while True:
+            gevent.sleep(self.idle_timeout / 2.0)
+            self.reap()
+
+    def reap(self):
+        """
+        Close connections that have been idle for longer than idle_timeout.
+        """
+        cutoff = self.clock() - self.idle_timeout
+        # The least recently released connections are at the front.
+        while self._idle and self._idle[0][0] < cutoff:
+            self._close(self._idle.pop(0)[1])
+
+    def acquire(self):
+        return self._checkout()[0]
+
+    def _checkout(self, fresh=False):
+        # Returns a connection and whether it was reused from the pool; with
+        # fresh, a new connection is always made.
+        if self.closed:
+            raise PoolExhausted("The pool is closed")
+        if not self._slots.acquire(timeout=cap_timeout(self.acquire_timeout)):
+            self.timeouts += 1
+            raise PoolExhausted("No connection became free within {0}s"
+                                .format(self.acquire_timeout))
+        if self._idle and not fresh:
+            return self._idle.pop()[1], True
+        try:
+            conn = self.connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        self.open += 1
+        self.created += 1
+        return conn, False
+
+    def release(self, conn):
+        if self.closed:
+            self._close(conn)
+        else:
+            self._idle.append((self.clock(), conn))
+        self._slots.release()
+
+    def discard(self, conn):
+        """
+        Close a connection instead of returning it to the pool, e.g. because
+        it failed.
+        """
+        self._close(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of the block. If the block
+        raises, the connection is assumed broken and closed.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.discard(conn)
+            raise
+        self.release(conn)
+
+    def check(self):
+        # Probe on a connection of its own, outside the pool's slots, so
+        # that a pool that is merely busy isn't reported unhealthy.
+        conn = self.connect()
+        try:
+            if self.probe is not None and self.probe(conn) is False:
+                raise IOError("Probe failed")
+        finally:
+            self.close_connection(conn)
+        return Result.ok("{0} of {1} connections in use".format(
+            self.in_use, self.max_size))
+
+    def register_metrics(self, registry, name):
+        registry.gauge("droppy.resources.pool.in_use", pool=name,
+                       func=lambda: self.in_use)
+        registry.gauge("droppy.resources.pool.idle", pool=name,
+                       func=lambda: self.idle)
+        registry.gauge("droppy.resources.pool.created", pool=name,
+                       func=lambda: self.created)
+        registry.gauge("droppy.resources.pool.timeouts", pool=name,
+                       func=lambda: self.timeouts)
+
+
+class HTTPClientPool(ConnectionPool):
+    """
+    A pool of keep-alive HTTP(S) connections to the server at url.
+
+        status, headers, body = pool.request('GET', '/search?q=droppy')
+
+    Requests time out after timeout seconds, or sooner if the current
+    request's deadline is closer.
+    """
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+    def __init__(self, url, timeout=5.0, health_path=None, **kwargs):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme == 'https':
+            connection_class = httplib.HTTPSConnection
+        else:
+            connection_class = httplib.HTTPConnection
+        self.host, self.port = parts.hostname, parts.port
+        self.timeout = timeout
+        self.health_path = health_path
+
+        def connect():
+            conn = connection_class(self.host, self.port, timeout=timeout)
+            conn.connect()
+            return conn
+
+        ConnectionPool.__init__(self, connect, probe=self._probe, **kwargs)
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        Make a pool from an HTTPClientConfiguration section.
+        """
+        kwargs.setdefault('timeout', config.connectTimeout)
+        kwargs.setdefault('health_path', config.healthPath or None)
+        return super(HTTPClientPool, cls).from_config(config, config.url,
+                                                      **kwargs)
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        """
+        Make a request, returning a (status, headers, body) tuple.
+
+        If an idempotent request fails on a pooled connection while it is
+        being sent, or the server closes the connection without answering,
+        most likely because the server closed it while it was idle, the
+        request is retried once on a new connection. Timeouts, and errors
+        once the request has been sent, are never retried, as the server
+        may already have acted on the request.
+        """
+        for attempt in (0, 1):
+            conn, reused = self._checkout(fresh=attempt > 0)
+            retry = (reused and attempt == 0 and
+                     method.upper() in self.IDEMPOTENT_METHODS)
+            try:
+                conn.sock.settimeout(cap_timeout(timeout or self.timeout))
+                try:
+                    conn.request(method, path, body, headers or {})
+                except socket.timeout:
+                    raise
+                except socket.error:
+                    if not retry:
+                        raise
+                    self.discard(conn)
+                    continue
+                try:
+                    response = conn.getresponse()
+                except httplib.BadStatusLine as e:
+                    if not retry or not _nothing_received(e):
+                        raise
+                    self.discard(conn)
+                    continue
+            except BaseException:
+                self.discard(conn)
+                raise
+            break
+        try:
+            data = response.read()
+        except BaseException:
+            self.discard(conn)
+            raise
+        if response.will_close:
+            self.discard(conn)
+        else:
+            self.release(conn)
+        return response.status, response.getheaders(), data
+
+    def _probe(self, conn):
+        if self.health_path is None:
+            return True
+        conn.request('HEAD', self.health_path)
+        response = conn.getresponse()
+        response.read()
+        return response.status < 500
+
+
+def _nothing_received(error):
+    # httplib reports a connection closed before the status line as a
+    # BadStatusLine whose line is empty, or the repr of the empty string.
+    return not error.line or error.line == repr('')
+
+
+class SocketPool(ConnectionPool):
+    """
+    A pool of plain TCP sockets connected to host:port, for backends with
+    their own wire protocol such as Redis or memcached.
+    """
+
+    def __init__(self, host, port, timeout=5.0, **kwargs):
+        self.address = (host, port)
+        self.timeout = timeout
+        ConnectionPool.__init__(
+            self, lambda: socket.create_connection(self.address, timeout),
+            **kwargs)
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        Make a pool from a SocketPoolConfiguration section.
+        """
+        kwargs.setdefault('timeout', config.connectTimeout)
+        return super(SocketPool, cls).from_config(config, config.host,
+                                                  config.port, **kwargs)
@@ -0,0 +1,111 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import os
+
+import bottle
+import gevent
+
+from droppy.metrics import to_dict, to_prometheus
+from droppy.cache import caches
+from droppy.tasks import TaskQueue
+from .profiling import SamplingProfiler, ProfilerBusy, dump_greenlets
+
+
+# Upper bound on the length of a profile requested through the admin server.
+MAX_PROFILE_SECONDS = 60
+
+
+def create_admin_bottle(app):
+    """
+    Build the bottle application served on the admin port.
+
+    With several worker processes, the workers share the admin port, and
+    each request is answered by whichever worker accepts it: metrics,
+    pools, caches, tasks and profiles describe that one process only. The
+    X-Droppy-Worker response header gives its pid, and metrics carry it
+    as a worker label.
+    """
+    admin = bottle.Bottle()
+
+    @admin.hook('after_request')
+    def worker_header():
+        bottle.response.set_header('X-Droppy-Worker', str(os.getpid()))
+
+    @admin.get('/pools')
+    def pools():
+        occupancy = app.farm.occupancy()
+        return dict((name, {'running': running, 'size': size})
+                    for name, (running, size) in occupancy.iteritems())
+
+    @admin.get('/metrics')
+    def metrics():
+        fmt = bottle.request.query.get('format')
+        if fmt is None and 'text/plain' in bottle.request.headers.get(
+                'Accept', ''):
+            fmt = 'prometheus'
+        if fmt == 'prometheus':
+            bottle.response.content_type = 'text/plain; version=0.0.4'
+            return to_prometheus(app.metrics)
+        return to_dict(app.metrics)
+
+    @admin.get('/healthcheck')
+    def healthcheck():
+        results = app.health_checks.run_checks()
+        if not all(r.healthy for r in results.itervalues()):
+            bottle.response.status = 500
+        return dict((name, result.to_dict())
+                    for name, result in results.iteritems())
+
+    @admin.get('/caches')
+    def route_caches():
+        return dict((name, cache.stats())
+                    for name, cache in caches().iteritems())
+
+    @admin.get('/tasks')
+    def tasks():
+        return dict((name, resource.stats())
+                    for name, resource in app.resources.iteritems()
+                    if isinstance(resource, TaskQueue))
+
+    @admin.get('/pprof/profile')
+    def profile():
+        try:
+            seconds = float(bottle.request.query.get('seconds', 10))
+            interval = float(bottle.request.query.get('interval', 5)) / 1000.0
+        except ValueError:
+            raise bottle.HTTPError(400, "seconds and interval must be numbers")
+        seconds = min(max(seconds, 0), MAX_PROFILE_SECONDS)
+        interval = max(interval, 0.001)
+        profiler = SamplingProfiler(interval)
+        try:
+            profiler.start()
+        except ProfilerBusy as e:
+            raise bottle.HTTPError(409, str(e))
+        try:
+            gevent.sleep(seconds)
+        finally:
+            profiler.stop()
+        bottle.response.content_type = 'text/plain'
+        return profiler.collapsed()
+
+    @admin.get('/greenlets')
+    def greenlets():
+        bottle.response.content_type = 'text/plain'
+        return dump_greenlets(app.farm.pools)
+
+    return admin
@@ -0,0 +1,122 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import time
+from collections import deque
+
+from gevent.event import Event
+
+from droppy.metrics import Counter
+
+
+class AdmissionController(object):
+    """
+    WSGI middleware that runs at most limit requests at once. Up to
+    max_queue further requests wait for a slot and the rest are rejected
+    straight away with a 503 and a Retry-After header.
+
+    How long a request may wait follows CoDel: while the queue keeps
+    draining, a request waits up to interval seconds for a slot, but once
+    the queue has stayed non-empty for a whole interval the server is
+    overloaded and waits are cut to target, so that the queue drains and
+    the requests that are admitted keep their latency.
+
+    The slot is released when the application returns, so the time spent
+    iterating a streamed response body is not counted.
+    """
+
+    def __init__(self, application, limit, max_queue=100, target=0.005,
+                 interval=0.1, retry_after=1, clock=time.time):
+        self.application = application
+        self.limit = limit
+        self.max_queue = max_queue
+        self.target = target
+        self.interval = interval
+        self.retry_after = retry_after
+        self.clock = clock
+        self.active = 0
+        self.rejected = Counter()
+        self._waiters = deque()
+        self._last_empty = clock()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def configure(self, config):
+        """
+        Apply the limits from an http configuration section.
+        """
+        self.max_queue = config.maxQueue
+        self.target = config.queueTarget
+        self.interval = config.queueInterval
+        self.retry_after = config.retryAfter
+        self.resize(config.maxConcurrency)
+
+    def resize(self, limit):
+        self.limit = limit
+        while self._waiters and self.active < self.limit:
+            self.active += 1
+            self._wake()
+
+    def _drained(self):
+        if not self._waiters:
+            self._last_empty = self.clock()
+
+    def _wake(self):
+        self._waiters.popleft().set()
+        self._drained()
+
+    def _acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._last_empty = self.clock()
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return False
+        if self.clock() - self._last_empty > self.interval:
+            timeout = self.target
+        else:
+            timeout = self.interval
+        waiter = Event()
+        self._waiters.append(waiter)
+        waiter.wait(timeout)
+        if waiter.is_set():
+            # The releasing request handed its slot over to us.
+            return True
+        self._waiters.remove(waiter)
+        self._drained()
+        return False
+
+    def _release(self):
+        if self._waiters and self.active <= self.limit:
+            self._wake()
+        else:
+            self.active -= 1
+            self._drained()
+
+    def __call__(self, environ, start_response):
+        if not self._acquire():
+            self.rejected.count += 1
+            start_response("503 Service Unavailable", [
+                ('Content-Type', 'text/plain'),
+                ('Retry-After', str(self.retry_after))])
+            return ["Service Unavailable\n"]
+        try:
+            return self.application(environ, start_response)
+        finally:
+            self._release()
@@ -0,0 +1,85 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+WSGI server backends.
+
+A backend is a callable taking a bound listening socket, a WSGI application
+and the http configuration section, and returning a gevent-style server
+(one with set_spawn(), start() and stop()) so that it can run in a
+ServerFarm. Register additional backends with register_backend().
+"""
+from droppy.config import ConfigurationException
+
+
+_BACKENDS = {}
+
+
+def register_backend(name, factory):
+    _BACKENDS[name] = factory
+
+
+def get_backend(name):
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        raise ConfigurationException(
+            "Unknown server backend {0}; choose one of {1}".format(
+                name, ', '.join(sorted(_BACKENDS))))
+
+
+def backend_names():
+    return sorted(_BACKENDS)
+
+
+def _configure(server, config):
+    server.max_accept = config.maxAccept
+    return server
+
+
+def gevent_wsgi(listener, application, config):
+    """
+    gevent.wsgi.WSGIServer. Before gevent 1.0 this is the C server built on
+    libevent's HTTP support, the fastest option for small responses; since
+    1.0 it is an alias for pywsgi.
+    """
+    from gevent import wsgi
+    return _configure(wsgi.WSGIServer(listener, application, log="default"),
+                      config)
+
+
+def gevent_pywsgi(listener, application, config):
+    """
+    gevent.pywsgi.WSGIServer, a pure-Python HTTP/1.1 server that supports
+    keep-alive connections, chunked requests and streaming responses.
+    """
+    from gevent import pywsgi
+    handler_class = None
+    if not config.keepAlive:
+        class CloseConnectionHandler(pywsgi.WSGIHandler):
+            def read_request(self, raw_requestline):
+                result = pywsgi.WSGIHandler.read_request(self, raw_requestline)
+                self.close_connection = True
+                return result
+        handler_class = CloseConnectionHandler
+    return _configure(pywsgi.WSGIServer(listener, application, log="default",
+                                        handler_class=handler_class),
+                      config)
+
+
+register_backend('gevent', gevent_wsgi)
+register_backend('pywsgi', gevent_pywsgi)
@@ -15,26 +15,27 @@
 ##  limitations under the License.
 ##
 ###############################################################################
-from gevent import monkey, wsgi
-monkey.patch_all()
-
+import os
 import logging
 
-import bottle
-
 from droppy.command import Subcommand
-from .server import ServerFarm
 
 
 log = logging.getLogger("droppy.server")
 
 
 class ServerSubcommand(Subcommand):
+    patch_gevent = True
+
     def __init__(self):
         Subcommand.__init__(self, "server", "Run the server")
+        self._admission = None
 
     def configure(self, parser):
         parser.add_argument("--test", help="A test")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Number of worker processes to fork "
+                                 "(overrides http.workers)")
 
     def _log_routes(self, app):
         msg = ["The following routes were found:", ""]
@@ -48,35 +49,169 @@ class ServerSubcommand(Subcommand):
         logging.basicConfig(format=config.logging.format,
                             level=config.logging.level)
 
+    def _bind(self, http, reuse_port=False):
+        from .server import create_listener
+        return {
+            'admin': create_listener((http.host, http.adminPort),
+                                     backlog=http.backlog,
+                                     reuse_port=reuse_port),
+            'main': create_listener((http.host, http.port),
+                                    backlog=http.backlog,
+                                    reuse_port=reuse_port),
+        }
+
+    def _serve(self, app, listeners=None, worker=False):
+        from .server import ServerFarm
+        from .backends import get_backend
+        from .admission import AdmissionController
+        http = app.config.http
+        if worker:
+            # Workers share the admin port, so any of them may answer a
+            # scrape; label the metrics with the one that did.
+            app.metrics.labels['worker'] = str(os.getpid())
+        if listeners is None:
+            listeners = self._bind(http, reuse_port=True)
+
+        backend = get_backend(http.server)
+
+        def factory(bottle_app):
+            return lambda sock: backend(sock, bottle_app, http)
+
+        admin_factory = factory(app._admin_bottle)
+        main_size = http.maxConcurrency
+        if http.loadShedding:
+            # The controller bounds the requests in progress instead of the
+            # pool, so that excess connections are accepted and turned away
+            # rather than left waiting in the backlog.
+            self._admission = AdmissionController(app._main_bottle, 0)
+            self._admission.configure(http)
+            self._register_admission_metrics(app, self._admission)
+            main_factory = factory(self._admission)
+            main_size = None
+        else:
+            main_factory = factory(app._main_bottle)
+
+        app._farm = farm = ServerFarm()
+        farm.add(admin_factory(listeners['admin']),
+                 size=http.adminMaxConcurrency, name="admin",
+                 factory=admin_factory)
+        farm.add(main_factory(listeners['main']),
+                 size=main_size, name="main",
+                 factory=main_factory)
+        self._register_pool_gauges(app, farm)
+        self._register_cache_gauges(app)
+        if app.arguments.watch_config:
+            app.watch_configuration()
+        # Started here, in each worker, so that no connection is shared
+        # between forked processes.
+        app.start_resources()
+        farm.on_stop(app.close_resources)
+        farm.install_signal_handlers(http.shutdownGracePeriod)
+        farm.serve_forever(http.shutdownGracePeriod)
+
+    def _register_pool_gauges(self, app, farm):
+        # Look pools up by name on every read, since a reload replaces them.
+        for name in farm.pools:
+            app.metrics.gauge("droppy.server.pool.running", server=name,
+                              func=lambda n=name: farm.occupancy()[n][0])
+            app.metrics.gauge("droppy.server.pool.size", server=name,
+                              func=lambda n=name: farm.occupancy()[n][1])
+
+    def _register_admission_metrics(self, app, admission):
+        app.metrics.register("droppy.server.admission.rejected",
+                             admission.rejected)
+        app.metrics.gauge("droppy.server.admission.active",
+                          func=lambda: admission.active)
+        app.metrics.gauge("droppy.server.admission.queued",
+                          func=lambda: admission.queued)
+
+    def _register_cache_gauges(self, app):
+        # Caches are looked up by name on every read, since CachePlugin
+        # creates them lazily and may replace them if routes are reset.
+        from droppy.cache import caches, watch_caches
+
+        def register(name):
+            app.metrics.gauge("droppy.cache.hit_ratio", cache=name,
+                              func=lambda: caches()[name].hit_ratio())
+            app.metrics.gauge("droppy.cache.bytes", cache=name,
+                              func=lambda: caches()[name].bytes)
+            app.metrics.gauge("droppy.cache.size", cache=name,
+                              func=lambda: len(caches()[name]))
+        watch_caches(register)
+
+    def _configuration_changed(self, app, old, new):
+        logging.getLogger().setLevel(new.logging.level)
+        app.health_checks.ttl = new.health.cacheTtl
+        app.health_checks.timeout = new.health.timeout
+        farm = app._farm
+        if farm is None:
+            return
+        sizes = {'admin': new.http.adminMaxConcurrency,
+                 'main': new.http.maxConcurrency}
+        if self._admission is not None:
+            self._admission.configure(new.http)
+            sizes['main'] = None
+        current = dict((name, size) for name, (running, size)
+                       in farm.occupancy().iteritems())
+        if sizes != current:
+            log.info("Resizing server pools to %s", sizes)
+            farm.reload(new.http.shutdownGracePeriod, sizes)
+
     def run(self, app):
+        # Handlers read the configuration on every request; give them the
+        # compact read-only snapshot rather than the validating schema.
+        app.config = app.config.freeze()
         self.configure_logging(app.config)
 
-        http = app.config.http
-        host, port, admin = http.host, http.port, http.adminPort
-        servers = []
-
-        class DroppyGeventServer(bottle.ServerAdapter):
-            def run(self, handler):
-                servers.append(wsgi.WSGIServer((self.host, self.port), handler, log="default"))
+        # The server is only imported now, once Application.run has had
+        # gevent patch the standard library: bottle makes its request and
+        # response objects thread-locals when it's imported, and the rest
+        # use sockets and threading.
+        import bottle
+        from droppy.metrics import RouteMetricsPlugin
+        from droppy.cache import CachePlugin
+        from droppy.ratelimit import RateLimitPlugin
+        from .admin import create_admin_bottle
+        from .backends import get_backend
+        from .prefork import PreforkMaster
+        from .timeouts import RequestTimeoutPlugin
 
-        farm = ServerFarm(2)
+        http = app.config.http
+        workers = app.arguments.workers or http.workers
+        # Fail on an unknown backend now, rather than in every worker.
+        get_backend(http.server)
 
         app._main_bottle = main_app = bottle.default_app()
-        app._admin_bottle = admin_app = bottle.Bottle()
+        app._admin_bottle = admin_app = create_admin_bottle(app)
+        app.health_checks.ttl = app.config.health.cacheTtl
+        app.health_checks.timeout = app.config.health.timeout
+        if http.requestMetrics:
+            main_app.install(RouteMetricsPlugin(app.metrics))
+        # Installed even without a default timeout, for routes that set
+        # their own; routes without one are left unwrapped.
+        timeouts = RequestTimeoutPlugin(http.requestTimeout)
+        app.metrics.register("droppy.requests.timeouts", timeouts.timed_out)
+        main_app.install(timeouts)
+        if app.config.rateLimit.enabled:
+            # Created before any workers are forked, so that a shared table
+            # is shared by all of them.
+            limiter = RateLimitPlugin(app.config.rateLimit)
+            app.metrics.register("droppy.ratelimit.rejected", limiter.rejected)
+            main_app.install(limiter)
+        main_app.install(CachePlugin())
+        app.add_config_listener(
+            lambda old, new: self._configuration_changed(app, old, new))
         app._on_server.set()
 
         log.info("Starting %s" % app.name)
-
-        log.info("Starting admin server...")
-        admin_app.run(host=host, port=admin, server=DroppyGeventServer)
+        log.info("Admin server listening on %s:%d", http.host, http.adminPort)
         self._log_routes(admin_app)
-
-        log.info("Starting main server...")
-        main_app.run(host=host, port=port, server=DroppyGeventServer)
+        log.info("Main server listening on %s:%d", http.host, http.port)
         self._log_routes(main_app)
 
-        for server in servers:
-            farm.add(server)
-
-        farm.serve_forever(2)
-
+        if workers > 1:
+            listeners = None if http.reusePort else self._bind(http)
+            PreforkMaster(lambda: self._serve(app, listeners, worker=True),
+                          workers, stop_timeout=http.shutdownGracePeriod).run()
+        else:
+            self._serve(app, self._bind(http))
@@ -0,0 +1,185 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import os
+import time
+import errno
+import signal
+import logging
+
+import gevent
+
+
+log = logging.getLogger("droppy.server")
+
+
+class PreforkMaster(object):
+    """
+    Forks a number of worker processes, each of which runs target, and keeps
+    that many alive until told to stop. Listening sockets should be bound
+    before the master runs so that every worker inherits them.
+
+    SIGTERM and SIGINT stop the workers and then the master. SIGHUP starts a
+    fresh generation of workers and then asks the old generation to finish
+    its in-flight requests and exit, so the sockets keep being served
+    throughout.
+    """
+    poll_interval = 0.5
+
+    # A worker that dies within this many seconds of being forked is
+    # considered to be crashing on startup; wait this long before replacing
+    # it so we don't spin forking doomed processes.
+    min_worker_lifetime = 1.0
+
+    # Extra time given to a worker beyond its grace period before it is
+    # killed outright.
+    kill_delay = 5.0
+
+    def __init__(self, target, workers, stop_timeout=10):
+        self.target = target
+        self.num_workers = workers
+        self.stop_timeout = stop_timeout
+        self.workers = {}
+        self._retiring = {}
+        self._stopping = False
+        self._watchers = []
+
+    def run(self):
+        log.info("Master %d starting %d workers", os.getpid(),
+                 self.num_workers)
+        self._install_signal_handlers()
+        try:
+            while not self._stopping:
+                self.reap_workers()
+                self.kill_stragglers()
+                self.manage_workers()
+                gevent.sleep(self.poll_interval)
+        finally:
+            self.stop_workers()
+
+    def stop(self):
+        self._stopping = True
+
+    def _install_signal_handlers(self):
+        self._watchers = [
+            gevent.signal(signal.SIGTERM, self.stop),
+            gevent.signal(signal.SIGINT, self.stop),
+            gevent.signal(signal.SIGHUP, self.reload),
+        ]
+
+    def _reset_signal_handlers(self):
+        for watcher in self._watchers:
+            watcher.cancel()
+        self._watchers = []
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    def spawn_worker(self):
+        pid = gevent.fork()
+        if pid:
+            self.workers[pid] = time.time()
+            log.info("Started worker %d", pid)
+            return pid
+        # In the worker
+        status = 0
+        try:
+            self._reset_signal_handlers()
+            self.target()
+        except SystemExit as e:
+            status = e.code or 0
+        except Exception:
+            log.exception("Worker %d failed", os.getpid())
+            status = 1
+        os._exit(status)
+
+    def manage_workers(self):
+        while (len(self.workers) - len(self._retiring) < self.num_workers
+               and not self._stopping):
+            self.spawn_worker()
+
+    def reload(self):
+        """
+        Replace every worker without dropping connections: the new workers
+        start accepting on the shared sockets before the old ones are told to
+        stop.
+        """
+        log.info("Reloading %d workers", self.num_workers)
+        old = [pid for pid in self.workers if pid not in self._retiring]
+        for i in range(self.num_workers):
+            self.spawn_worker()
+        deadline = time.time() + self.stop_timeout + self.kill_delay
+        for pid in old:
+            self._retiring[pid] = deadline
+            self._signal_worker(pid, signal.SIGTERM)
+
+    def kill_stragglers(self):
+        now = time.time()
+        for pid, deadline in self._retiring.items():
+            if now > deadline:
+                log.warning("Killing worker %d that did not stop in time", pid)
+                self._retiring[pid] = float('inf')
+                self._signal_worker(pid, signal.SIGKILL)
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    self.workers.clear()
+                    self._retiring.clear()
+                    return
+                raise
+            if not pid:
+                return
+            started = self.workers.pop(pid, None)
+            if started is None or self._retiring.pop(pid, None):
+                continue
+            if not self._stopping:
+                log.warning("Worker %d exited with status %d; replacing it",
+                            pid, status)
+                if time.time() - started < self.min_worker_lifetime:
+                    gevent.sleep(self.min_worker_lifetime)
+
+    def _signal_worker(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+            self.workers.pop(pid, None)
+            self._retiring.pop(pid, None)
+
+    def kill_workers(self, sig):
+        for pid in self.workers.keys():
+            self._signal_worker(pid, sig)
+
+    def stop_workers(self):
+        self._stopping = True
+        self.kill_workers(signal.SIGTERM)
+        deadline = time.time() + self.stop_timeout + self.kill_delay
+        while self.workers and time.time() < deadline:
+            self.reap_workers()
+            gevent.sleep(0.1)
+        if self.workers:
+            log.warning("Killing %d workers that did not stop in time",
+                        len(self.workers))
+            self.kill_workers(signal.SIGKILL)
+            while self.workers:
+                self.reap_workers()
+                gevent.sleep(0.1)
@@ -0,0 +1,123 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import gc
+import sys
+import signal
+import traceback
+
+from greenlet import greenlet
+
+
+class ProfilerBusy(Exception):
+    """
+    Another profile is already being collected.
+    """
+
+
+class SamplingProfiler(object):
+    """
+    A statistical CPU profiler. While running, SIGPROF fires every interval
+    seconds of CPU time used by the process, and the stack of whichever
+    greenlet was running at the time is recorded. An idle process receives
+    no signals, so the profiler costs nothing when there is nothing to
+    sample.
+
+    Only one profiler may run at a time, since there is only one SIGPROF
+    timer per process.
+    """
+    # Caps the memory used by a pathological profile with many distinct stacks.
+    max_stacks = 10000
+
+    _active = None
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = {}
+        self._previous_handler = None
+
+    def start(self):
+        if SamplingProfiler._active is not None:
+            raise ProfilerBusy("A profile is already being collected")
+        SamplingProfiler._active = self
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        # Otherwise every sample interrupts whatever system call the process
+        # is in, and requests see EINTR from their socket I/O.
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        previous = self._previous_handler
+        signal.signal(signal.SIGPROF,
+                      signal.SIG_DFL if previous is None else previous)
+        SamplingProfiler._active = None
+
+    def _sample(self, signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append("{0} ({1}:{2})".format(
+                code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        names.reverse()
+        key = ';'.join(names)
+        self.samples += 1
+        if key in self.stacks or len(self.stacks) < self.max_stacks:
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        else:
+            self.stacks['[truncated]'] = self.stacks.get('[truncated]', 0) + 1
+
+    def collapsed(self):
+        """
+        Return the samples in the collapsed-stack format read by flame graph
+        tools: one line per distinct stack, frames separated by semicolons,
+        followed by the number of samples.
+        """
+        lines = ["{0} {1}".format(stack, count) for stack, count in
+                 sorted(self.stacks.iteritems(), key=lambda x: -x[1])]
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def dump_greenlets(pools=None):
+    """
+    Return the stack of every live greenlet as text. pools maps a name to a
+    gevent pool; greenlets belonging to a pool are labelled with its name.
+    """
+    pools = pools or {}
+    output = []
+    for ob in gc.get_objects():
+        if not isinstance(ob, greenlet) or ob.dead:
+            continue
+        frame = ob.gr_frame
+        if ob is greenlet.getcurrent():
+            frame = sys._getframe()
+        elif frame is None:
+            # Not yet started
+            continue
+        owners = [name for name, pool in sorted(pools.iteritems())
+                  if ob in pool]
+        header = repr(ob)
+        if owners:
+            header += " [pool: {0}]".format(', '.join(owners))
+        output.append(header)
+        output.extend(line.rstrip('\n')
+                      for line in traceback.format_stack(frame))
+        output.append('')
+    return '\n'.join(output)
@@ -16,23 +16,79 @@
 ##
 ###############################################################################
 import sys
+import signal
+import socket
+import logging
 
+import gevent
 from gevent import spawn
-from gevent.pool import Pool
+from gevent.pool import Pool, Group
 from gevent.event import Event
 
 
+log = logging.getLogger("droppy.server")
+
+
+def create_listener(address, backlog=128, reuse_port=False):
+    """
+    Bind and listen on a TCP socket. With reuse_port, the socket is opened
+    with SO_REUSEPORT so that several processes can bind the same address and
+    let the kernel balance connections between them.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise ValueError("SO_REUSEPORT is not supported on this platform")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.setblocking(0)
+    return sock
+
+
 class ServerFarm(object):
     def __init__(self, size=None):
         self.started = False
         self.servers = []
         self.pool = Pool(size)
+        self._pools = []
+        self._factories = []
+        self._draining = Group()
+        self._stop_callbacks = []
         self._stop_event = Event()
         self._stop_event.set()
 
-    def add(self, server):
+    def add(self, server, size=None, name=None, factory=None):
+        """
+        Add a server to the farm. If size is given, the server gets its own
+        pool bounded to that many concurrent greenlets; otherwise it shares
+        the farm's default pool.
+
+        If factory is given, reload() calls it with a listening socket to
+        build a replacement for the server.
+        """
+        if name is None:
+            name = "server-{0}".format(len(self.servers))
+        pool = self.pool if size is None else Pool(size)
         self.servers.append(server)
-        server.set_spawn(self.pool.spawn)
+        self._pools.append((name, pool))
+        self._factories.append(factory)
+        # Handing gevent the pool itself, rather than its spawn method, lets
+        # the server stop accepting while the pool is full.
+        server.set_spawn(pool)
+
+    @property
+    def pools(self):
+        return dict(self._pools)
+
+    def occupancy(self):
+        """
+        Return a dict mapping server name to a (running, size) tuple
+        describing that server's greenlet pool.
+        """
+        return dict((name, (len(pool), pool.size))
+                    for name, pool in self._pools)
 
     def start(self):
         self.started = True
@@ -40,12 +96,72 @@ class ServerFarm(object):
         for server in self.servers:
             server.start()
 
+    def reload(self, timeout=None, sizes=None):
+        """
+        Replace each server that has a factory with a fresh instance accepting
+        on a duplicate of the same listening socket, then retire the old
+        instance, giving its in-flight requests up to timeout seconds to
+        finish. The socket itself is never closed, so no connection is
+        refused while this happens.
+
+        sizes optionally maps server names to new pool sizes.
+        """
+        sizes = sizes or {}
+        log.info("Reloading servers")
+        for i, factory in enumerate(self._factories):
+            if factory is None:
+                continue
+            old, (name, old_pool) = self.servers[i], self._pools[i]
+            new = factory(old.socket.dup())
+            if old_pool is self.pool:
+                pool = self.pool
+            else:
+                pool = Pool(sizes.get(name, old_pool.size))
+            new.set_spawn(pool)
+            if self.started:
+                new.start()
+            self.servers[i] = new
+            self._pools[i] = (name, pool)
+            if pool is old_pool:
+                # The shared pool is still in use by the replacement, so
+                # there is nothing to drain; just stop accepting.
+                old.close()
+            else:
+                self._draining.spawn(old.stop, timeout=timeout)
+
     def stop(self, timeout=None):
+        """
+        Stop accepting connections and wait up to timeout seconds for
+        in-flight requests to finish before killing them.
+        """
         self._stop_event.set()
+        stopping = Group()
         for server in self.servers[:]:
-            server.stop()
+            stopping.spawn(server.stop, timeout=timeout)
+        stopping.join()
+        self._draining.join()
         self.pool.join(timeout=timeout)
         self.pool.kill(block=True, timeout=1)
+        for callback in self._stop_callbacks:
+            try:
+                callback()
+            except Exception:
+                log.exception("Stop callback %r failed", callback)
+
+    def on_stop(self, callback):
+        """
+        Call callback() once the farm has stopped and its in-flight requests
+        have finished, e.g. to close resources the requests were using.
+        """
+        self._stop_callbacks.append(callback)
+
+    def install_signal_handlers(self, timeout=None):
+        """
+        Stop the farm when the process receives SIGTERM, and reload it on
+        SIGHUP. timeout is the grace period given to in-flight requests.
+        """
+        gevent.signal(signal.SIGTERM, self._stop_event.set)
+        gevent.signal(signal.SIGHUP, self.reload, timeout)
 
     def serve_forever(self, stop_timeout=None):
         if not self.started:
@@ -56,5 +172,3 @@ class ServerFarm(object):
             sys.exit(0)
         finally:
             spawn(self.stop, timeout=stop_timeout).join()
-
-
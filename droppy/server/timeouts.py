@@ -0,0 +1,59 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import gevent
+
+from droppy.metrics import Counter
+from droppy.concurrency import within
+
+
+class RequestTimeoutPlugin(object):
+    """
+    A bottle plugin that gives each request a deadline of timeout seconds
+    and answers it with a 503 if the route hasn't returned by then. Routes
+    can set their own limit with a request_timeout option in their route
+    config, or 0 for none.
+
+    Like any gevent.Timeout, this can only interrupt a handler when it
+    yields to the hub, e.g. on I/O; CPU-bound code runs to completion.
+    """
+    name = 'droppy.timeout'
+    api = 2
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.timed_out = Counter()
+
+    def apply(self, callback, route):
+        import bottle
+        timeout = route.config.get('request_timeout', self.timeout)
+        if not timeout:
+            return callback
+        timed_out = self.timed_out
+
+        def wrapper(*args, **kwargs):
+            with within(timeout) as timer:
+                try:
+                    return callback(*args, **kwargs)
+                except gevent.Timeout as e:
+                    if e is not timer:
+                        raise
+                    timed_out.count += 1
+                    raise bottle.HTTPResponse("Request timed out\n",
+                                              status=503)
+
+        return wrapper
@@ -0,0 +1,198 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import time
+import logging
+
+import gevent
+from gevent import queue
+
+from droppy.metrics import Counter, Timer
+from droppy.resources import Resource
+
+
+log = logging.getLogger("droppy.tasks")
+
+
+OVERFLOW_POLICIES = ('block', 'drop', 'dropOldest')
+
+
+class QueueFull(Exception):
+    """
+    Raised by TaskQueue.submit when a task can't be queued.
+    """
+
+
+class TaskQueue(Resource):
+    """
+    Runs functions in the background on concurrency greenlets of its own,
+    separate from the greenlets serving requests, taking them from a queue
+    of at most size tasks.
+
+    overflow decides what submit() does when the queue is full:
+
+      block       wait up to block_timeout seconds for room, then raise
+                  QueueFull, pushing back on the caller
+      drop        discard the new task
+      dropOldest  discard the task that has waited longest
+
+    A task that raises is retried up to retries times, waiting retry_delay
+    seconds before the first retry and twice as long before each after.
+    """
+
+    def __init__(self, size=1000, concurrency=4, overflow='block',
+                 block_timeout=1.0, retries=0, retry_delay=1.0,
+                 drain_timeout=10.0, clock=time.time):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {0}".format(
+                ', '.join(OVERFLOW_POLICIES)))
+        self.size = size
+        self.concurrency = concurrency
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.drain_timeout = drain_timeout
+        self.clock = clock
+        self.closed = False
+        self.submitted = Counter()
+        self.dropped = Counter()
+        self.retried = Counter()
+        self.failed = Counter()
+        self.wait = Timer(clock)
+        self.latency = Timer(clock)
+        self._queue = queue.Queue(size)
+        self._workers = []
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        Make a queue from a TaskQueueConfiguration section.
+        """
+        kwargs.setdefault('size', config.size)
+        kwargs.setdefault('concurrency', config.concurrency)
+        kwargs.setdefault('overflow', config.overflow)
+        kwargs.setdefault('block_timeout', config.blockTimeout)
+        kwargs.setdefault('retries', config.retries)
+        kwargs.setdefault('retry_delay', config.retryDelay)
+        kwargs.setdefault('drain_timeout', config.drainTimeout)
+        return cls(**kwargs)
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self.closed = False
+        self._workers = [w for w in self._workers if not w.dead]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(gevent.spawn(self._work))
+
+    def close(self):
+        """
+        Stop taking tasks, and give those already queued up to drain_timeout
+        seconds to finish before the workers are killed.
+        """
+        self.closed = True
+        deadline = self.clock() + self.drain_timeout
+        while self._queue.qsize() and self.clock() < deadline:
+            gevent.sleep(0.05)
+        # None tells a worker to exit once it has finished its current task.
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        gevent.joinall(self._workers,
+                       timeout=max(deadline - self.clock(), 0))
+        gevent.killall(self._workers)
+        self._workers = []
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) to be run in the background. Returns
+        False if the task was dropped.
+        """
+        if self.closed:
+            raise QueueFull("The task queue is closed")
+        if (len(self._workers) < self.concurrency or
+                any(w.dead for w in self._workers)):
+            # Not started yet, or a worker has died and needs replacing.
+            self.start()
+        task = (self.clock(), func, args, kwargs)
+        self.submitted.count += 1
+        if self.overflow == 'block':
+            try:
+                self._queue.put(task, timeout=self.block_timeout)
+            except queue.Full:
+                self.dropped.count += 1
+                raise QueueFull("No room in the task queue after {0}s"
+                                .format(self.block_timeout))
+            return True
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            self.dropped.count += 1
+            if self.overflow == 'drop':
+                return False
+            self._queue.get_nowait()
+            self._queue.put_nowait(task)
+        return True
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            submitted, func, args, kwargs = task
+            start = self.clock()
+            self.wait.update(start - submitted)
+            self._run(func, args, kwargs)
+            self.latency.update(self.clock() - start)
+
+    def _run(self, func, args, kwargs):
+        delay = self.retry_delay
+        for attempt in xrange(self.retries + 1):
+            try:
+                func(*args, **kwargs)
+                return
+            except (Exception, gevent.Timeout):
+                # A gevent.Timeout the task didn't catch would otherwise
+                # kill the worker.
+                if attempt == self.retries:
+                    self.failed.count += 1
+                    log.exception("Background task %r failed", func)
+                    return
+            self.retried.count += 1
+            gevent.sleep(delay)
+            delay *= 2
+
+    def stats(self):
+        return {'depth': self.depth, 'size': self.size,
+                'submitted': self.submitted.count,
+                'dropped': self.dropped.count,
+                'retried': self.retried.count,
+                'failed': self.failed.count,
+                'latency': self.latency.value()}
+
+    def register_metrics(self, registry, name):
+        registry.gauge("droppy.tasks.depth", queue=name,
+                       func=lambda: self.depth)
+        for metric in ('submitted', 'dropped', 'retried', 'failed', 'wait',
+                       'latency'):
+            registry.register("droppy.tasks." + metric, getattr(self, metric),
+                              queue=name)
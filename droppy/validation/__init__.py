@@ -16,6 +16,8 @@
 ##
 ###############################################################################
 from .properties import ParsedDocument, ParsedProperty
+from .body import validate_body
+from .frozen import FrozenDocument
 from .validators import (StringBool, Bool, Int, Number, UnicodeString, Set,
                          String, NotEmpty, ConfirmType, Constant, OneOf,
                          StripField, DictConverter, IndexListConverter,
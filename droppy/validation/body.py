@@ -0,0 +1,66 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import json
+from functools import wraps
+
+from formencode import Invalid
+
+from .properties import _plan_for
+from .parsing import json_loads
+
+
+def _json_error(status, errors):
+    import bottle
+    return bottle.HTTPResponse(json.dumps({'errors': errors}), status=status,
+                               headers={'Content-Type': 'application/json'})
+
+
+def validate_body(document_class, argument='body'):
+    """
+    Decorate a bottle route so that its request body is parsed as JSON and
+    validated against document_class, a ParsedDocument subclass. The loaded
+    document is passed to the route as the keyword argument named by
+    argument.
+
+    A body that isn't JSON is rejected with a 400; one that fails
+    validation with a 422 whose JSON body maps each field to its error. An
+    empty body is validated as an empty document, so that every field takes
+    its default.
+    """
+    # Imported here so that droppy.validation doesn't pull in bottle for
+    # applications that only use it to load configuration.
+    import bottle
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            raw = bottle.request.body.read()
+            if raw.strip():
+                try:
+                    data = json_loads(raw)
+                except ValueError as e:
+                    raise _json_error(400, "Malformed JSON: {0}".format(e))
+            else:
+                data = {}
+            try:
+                kwargs[argument] = _plan_for(document_class).load(data)
+            except Invalid as e:
+                raise _json_error(422, e.unpack_errors())
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
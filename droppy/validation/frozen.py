@@ -0,0 +1,84 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+class FrozenDocument(object):
+    """
+    Base class for read-only snapshots of loaded documents. Each document
+    class gets its own subclass with a slot per field, so reading a value is
+    a plain slot lookup and a snapshot carries none of the validation
+    machinery of the document it was made from.
+    """
+    __slots__ = ()
+
+    def __init__(self, values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{0} is frozen".format(self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{0} is frozen".format(self.__class__.__name__))
+
+    def _asdict(self):
+        d = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, FrozenDocument):
+                value = value._asdict()
+            d[name] = value
+        return d
+
+    def __eq__(self, other):
+        return (self.__class__ is other.__class__ and
+                all(getattr(self, n) == getattr(other, n)
+                    for n in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, ', '.join(
+            "{0}={1!r}".format(n, getattr(self, n)) for n in self.__slots__))
+
+
+def _frozen_class(cls, names):
+    frozen = cls.__dict__.get('_frozen_class')
+    if frozen is None:
+        frozen = type(cls.__name__ + 'Snapshot', (FrozenDocument,),
+                      {'__slots__': tuple(sorted(names))})
+        cls._frozen_class = frozen
+    return frozen
+
+
+def _freeze_value(value):
+    if hasattr(value, 'freeze'):
+        return value.freeze()
+    if isinstance(value, list):
+        return tuple(_freeze_value(v) for v in value)
+    return value
+
+
+def freeze(document, names):
+    """
+    Make a FrozenDocument holding document's values for the given field
+    names. Nested documents are frozen too, and lists become tuples.
+    """
+    values = {}
+    for name in names:
+        values[name] = _freeze_value(getattr(document, name, None))
+    return _frozen_class(document.__class__, names)(values)
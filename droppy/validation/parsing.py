@@ -0,0 +1,92 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+"""
+Parsing YAML and JSON documents as quickly as the installed libraries allow.
+"""
+try:
+    from ujson import loads as json_loads
+except ImportError:
+    try:
+        from simplejson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+
+# How much of a file is read to decide whether it's JSON.
+_HEAD_SIZE = 4096
+
+_SafeLoader = None
+
+
+def _yaml_load(stream):
+    # yaml takes a while to import, so leave it until there is some YAML to
+    # parse; commands run without a configuration file never need it.
+    global _SafeLoader
+    import yaml
+    if _SafeLoader is None:
+        # Written in C, when libyaml is installed.
+        _SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(stream, Loader=_SafeLoader)
+
+
+def _looks_like_json(text):
+    return text.lstrip()[:1] in ('{', '[')
+
+
+class _PrefixedStream(object):
+    """
+    A file that has had its first few bytes read, made whole again.
+    """
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+        self.name = getattr(stream, 'name', '<file>')
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._stream.read(size)
+        if size < 0:
+            data, self._head = self._head + self._stream.read(), ''
+        else:
+            data, self._head = self._head[:size], self._head[size:]
+        return data
+
+
+def parse(raw):
+    """
+    Parse a YAML or JSON string or file. Input that looks like JSON is
+    decoded with the fastest JSON library available, falling back to YAML if
+    that fails; everything else goes to YAML's safe loader, written in C when
+    libyaml is installed. Files that aren't JSON are streamed to the YAML
+    parser rather than read into memory first.
+    """
+    if hasattr(raw, 'read'):
+        head = raw.read(_HEAD_SIZE)
+        if not _looks_like_json(head):
+            return _yaml_load(_PrefixedStream(head, raw))
+        raw = head + raw.read()
+    if not raw.strip():
+        # What YAML makes of an empty document.
+        return None
+    if _looks_like_json(raw):
+        try:
+            return json_loads(raw)
+        except ValueError:
+            pass
+    return _yaml_load(raw)
@@ -19,10 +19,13 @@ import sys
 from functools import update_wrapper
 from copy import deepcopy
 
-import yaml
 from pyxdeco.advice import addClassAdvisor, getFrameInfo
 from formencode import Schema, FancyValidator, Invalid
 from formencode.api import NoDefault
+from formencode.schema import format_compound_error
+
+from .parsing import parse
+from .frozen import freeze
 
 
 _MARKER = object()
@@ -39,16 +42,217 @@ def _reset_fields(config_instance):
 
 
 def get_defaults(config_cls):
+    _resolve_properties(config_cls)
+    d = config_cls.__dict__.get('_defaults')
+    if d is None:
+        d = {}
+        for k, v in config_cls.fields.iteritems():
+            default = getattr(v, 'if_missing', _MARKER)
+            if isinstance(default, ParsedDocument):
+                default = get_defaults(default.__class__)
+            if default is not _MARKER:
+                d[k] = default
+        config_cls._defaults = d
+    return deepcopy(d)
+
+
+def _find_property(validator):
+    if isinstance(validator, ParsedProperty):
+        return validator
+    for v in getattr(validator, 'validators', ()):
+        if isinstance(v, ParsedProperty):
+            return v
+
+
+def _resolve_properties(cls):
+    """
+    Work out the defaults of a document class's properties, the first time
+    the class is instantiated rather than when it is defined, so that
+    importing a large configuration hierarchy doesn't build and validate
+    every schema in it. Properties whose default is itself a document
+    become nested fields.
+    """
+    if cls.__dict__.get('_properties_resolved'):
+        return
+    cls._properties_resolved = True
+    for name, validator in cls.fields.items():
+        prop = _find_property(validator)
+        if prop is None:
+            continue
+        default = prop.default_value
+        if isinstance(default, Schema):
+            default.__dict__['_nested'] = True
+            cls.fields[name] = default
+
+
+def _plan_for(cls):
+    # Look in the class's own __dict__, so a subclass never picks up the plan
+    # compiled for its parent.
+    plan = cls.__dict__.get('_validation_plan')
+    if plan is None:
+        plan = _ValidationPlan(cls)
+        cls._validation_plan = plan
+    return plan
+
+
+class _ValidationPlan(object):
+    """
+    A document class's fields flattened, once per class, into a list of
+    (name, validator, nested plan, default, accepts iterators) steps.
+    Loading a document is then a single pass over that list, building
+    nested documents with their own plans, instead of instantiating the
+    schema, resetting its nested fields and going through formencode's
+    generic Schema.to_python.
+
+    Each field's own validator still converts its value, so the results and
+    errors are the same as Schema.to_python's. Schemas with pre- or chained
+    validators fall back to the generic path.
+    """
+
+    def __init__(self, cls):
+        proto = cls()
+        self.cls = cls
+        self.proto = proto
+        self.names = frozenset(proto.fields)
+        self.generic = bool(proto.pre_validators or proto.chained_validators)
+        self.steps = []
+        self.nested = {}
+        for name, validator in sorted(proto.fields.iteritems()):
+            if isinstance(validator, ParsedDocument):
+                nested = self.nested[name] = _plan_for(validator.__class__)
+                self.steps.append((name, validator, nested, NoDefault, True))
+            else:
+                self.steps.append((
+                    name, validator, None,
+                    getattr(validator, 'if_missing', NoDefault),
+                    getattr(validator, 'accept_iterator', False)))
+
+    def new_instance(self):
+        inst = self.cls.__new__(self.cls)
+        inst.__dict__.update(self.proto.__dict__)
+        return inst
+
+    def build(self, values):
+        """
+        Make a document from a dict produced by load(..., as_dict=True),
+        without validating it again.
+        """
+        values = dict(values)
+        for name, nested in self.nested.iteritems():
+            if name in values:
+                values[name] = nested.build(values[name])
+        inst = self.new_instance()
+        inst.__dict__.update(values)
+        return inst
+
+    def _missing(self, validator):
+        try:
+            message = validator.message('missing', None)
+        except KeyError:
+            message = self.proto.message('missingValue', None)
+        return Invalid(message, None, None)
+
+    def load(self, value, as_dict=False):
+        """
+        Validate value, returning a new document, or with as_dict a plain
+        dict of the converted values with nested documents as dicts too.
+        """
+        if self.generic:
+            inst = self.cls()
+            _reset_fields(inst)
+            results = inst.to_python(value)
+            if as_dict:
+                return _as_dict(results)
+            return inst
+
+        proto = self.proto
+        if not value:
+            value = {}
+        proto.assert_dict(value, None)
+
+        result = {}
+        names = self.names
+        for name in value:
+            if name not in names:
+                if not proto.allow_extra_fields:
+                    raise Invalid(proto.message('notExpected', None,
+                                                name=repr(name)), value, None)
+                if not proto.filter_extra_fields:
+                    result[name] = value[name]
+
+        errors = {}
+        for name, validator, nested, default, accepts in self.steps:
+            if name in value:
+                v = value[name]
+                try:
+                    if nested is not None:
+                        v = nested.load(v, as_dict)
+                    elif not accepts and proto._value_is_iterator(v):
+                        validator.to_python(v)
+                        errors[name] = Invalid(
+                            proto.message('singleValueExpected', None),
+                            value, None)
+                        continue
+                    else:
+                        v = validator.to_python(v)
+                except Invalid as e:
+                    errors[name] = e
+                    continue
+            elif nested is not None:
+                try:
+                    v = nested.load({}, as_dict)
+                except Invalid:
+                    # No default is possible, because something underneath
+                    # is required.
+                    errors[name] = self._missing(validator)
+                    continue
+            elif default is not NoDefault:
+                v = default
+            elif proto.ignore_key_missing:
+                continue
+            elif proto.if_key_missing is NoDefault:
+                errors[name] = self._missing(validator)
+                continue
+            else:
+                try:
+                    v = validator.to_python(proto.if_key_missing)
+                except Invalid as e:
+                    errors[name] = e
+                    continue
+            result[name] = v
+
+        if errors:
+            raise Invalid(format_compound_error(errors), value, None,
+                          error_dict=errors)
+        if as_dict:
+            return result
+        inst = self.new_instance()
+        inst.__dict__.update(result)
+        return inst
+
+
+def _as_dict(results):
     d = {}
-    for k, v in config_cls.fields.iteritems():
-        default = getattr(v, 'if_missing', _MARKER)
-        if isinstance(default, ParsedDocument):
-            default = get_defaults(default.__class__)
-        if default is not _MARKER:
-            d[k] = default
+    for k, v in results.iteritems():
+        if isinstance(v, ParsedDocument):
+            v = _as_dict(dict((name, getattr(v, name)) for name in v.fields
+                              if hasattr(v, name)))
+        d[k] = v
     return d
 
 
+def _flatten(plan, d, prefix, out):
+    # Only nested documents are flattened; a field whose value happens to be
+    # a dict stays in a column of its own.
+    for k, v in d.iteritems():
+        nested = plan.nested.get(k)
+        if nested is not None and isinstance(v, dict):
+            _flatten(nested, v, prefix + k + '.', out)
+        else:
+            out[prefix + k] = v
+    return out
+
+
 class ParsedDocument(Schema):
     """
     Represents a document loaded from YAML or JSON that may have properties
@@ -56,24 +260,82 @@ class ParsedDocument(Schema):
     """
     NoDefault = NoDefault
 
+    def __init__(self, *args, **kwargs):
+        _resolve_properties(self.__class__)
+        super(ParsedDocument, self).__init__(*args, **kwargs)
+
+    @property
+    def if_missing(self):
+        """
+        For a document nested in another, its own defaults, loaded the first
+        time they're asked for.
+        """
+        try:
+            return self.__dict__['if_missing']
+        except KeyError:
+            pass
+        if not self.__dict__.get('_nested'):
+            return NoDefault
+        try:
+            value = self.__class__.default()
+        except Invalid:
+            # No default is possible, because something underneath
+            # is required.
+            value = NoDefault
+        self.__dict__['if_missing'] = value
+        return value
+
+    @if_missing.setter
+    def if_missing(self, value):
+        self.__dict__['if_missing'] = value
+
+    @staticmethod
+    def parse(raw):
+        """
+        Parse a YAML or JSON string or file; dictionaries are returned as is.
+        """
+        if isinstance(raw, dict):
+            return raw
+        return parse(raw)
+
     @classmethod
     def load(cls, raw):
         """
         Validate a parsed file or dictionary according to this schema.
         """
-        inst = cls()
-        _reset_fields(inst)
+        return _plan_for(cls).load(cls.parse(raw))
 
-        if isinstance(raw, dict):
-            loaded = raw
-        else:
-            loaded = yaml.load(raw)
-        inst.to_python(loaded)
-        return inst
+    @classmethod
+    def load_many(cls, items, columnar=False):
+        """
+        Validate each of an iterable of parsed dictionaries against this
+        schema, compiling the schema only once. A failure doesn't stop the
+        batch.
+
+        By default, returns a generator of (index, document, error) tuples,
+        where exactly one of document and error (the Invalid raised) is None.
+
+        With columnar=True, returns a (columns, errors) tuple instead.
+        columns maps each field name to a list of values, one per valid item,
+        with nested documents flattened into dotted names such as
+        "http.port"; errors maps the index of each invalid item to its
+        Invalid.
+        """
+        plan = _plan_for(cls)
+        if columnar:
+            return _load_columns(plan, items)
+        return _load_rows(plan, items)
 
     def list_properties(self):
         return self.fields.keys()
 
+    def freeze(self):
+        """
+        Return an immutable, slot-based snapshot of this document's values,
+        which is smaller and faster to read than the document itself.
+        """
+        return freeze(self, _plan_for(self.__class__).names)
+
     @classmethod
     def default(cls):
         return cls.load({})
@@ -88,29 +350,69 @@ class ParsedDocument(Schema):
         return results
 
 
+def _load_rows(plan, items):
+    for i, item in enumerate(items):
+        try:
+            yield i, plan.load(item), None
+        except Invalid as e:
+            yield i, None, e
+
+
+def _load_columns(plan, items):
+    columns, errors, n = {}, {}, 0
+    for i, item in enumerate(items):
+        try:
+            row = _flatten(plan, plan.load(item, as_dict=True), '', {})
+        except Invalid as e:
+            errors[i] = e
+            continue
+        for k, v in row.iteritems():
+            column = columns.get(k)
+            if column is None:
+                column = columns[k] = [None] * n
+            column.append(v)
+        n += 1
+        # Pad columns missing from this row, e.g. extra fields seen earlier.
+        if len(columns) != len(row):
+            for column in columns.itervalues():
+                if len(column) < n:
+                    column.append(None)
+    return columns, errors
+
+
 class ParsedProperty(FancyValidator):
     def __init__(self, func):
         self._func = func
+        self._owner = None
+        self._default = _MARKER
         self.accept_iterator = True
         update_wrapper(self, func)
         _addClassAdvisorToNearestClass(self._on_class)
         super(FancyValidator, self).__init__()
 
     def _on_class(self, cls):
-        method = self._func.__get__(cls(), cls)
-        default = method()
-        if isinstance(default, Schema):
-            cls.fields[self.__name__] = default
-            try:
-                default.if_missing = default.__class__.default()
-            except Invalid:
-                # No default is possible, because something underneath
-                # is required.
-                pass
-        else:
-            self.if_missing = default
+        self._owner = cls
         return cls
 
+    @property
+    def default_value(self):
+        """
+        The value returned by the decorated method, computed on first use.
+        The method is called on a bare instance of its class, since the
+        default shouldn't depend on any state.
+        """
+        if self._default is _MARKER:
+            owner = self._owner
+            self._default = self._func(owner.__new__(owner))
+        return self._default
+
+    @property
+    def if_missing(self):
+        default = self.default_value
+        if isinstance(default, Schema):
+            return NoDefault
+        return default
+
 
 def _addClassAdvisorToNearestClass(advisor):
     """
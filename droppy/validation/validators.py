@@ -34,8 +34,7 @@ def _validator_decorator(base, **extra_kwargs):
         def the_decorator(prop):
             if not isinstance(prop, fv.Validator):
                 prop = ParsedProperty(prop)
-            defaults.update(kwargs)
-            validator = base(*args, **defaults)
+            validator = base(*args, **dict(defaults, **kwargs))
             compound = All(prop, validator)
             return compound
 
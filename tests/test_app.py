@@ -0,0 +1,182 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import sys
+import unittest
+import subprocess
+from cStringIO import StringIO
+
+import gevent
+
+import droppy
+from droppy.application.startup import StartupProfile
+from droppy.resources import Resource
+from droppy.tasks import TaskQueue
+
+
+class TestAppAccessor(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = droppy.app()
+
+    def tearDown(self):
+        droppy.set_app(self.previous)
+
+    def test_set_app(self):
+        a = object()
+        droppy.set_app(a)
+        self.assertTrue(droppy.app() is a)
+        self.assertTrue(droppy.wait_for_app() is a)
+
+    def test_using_app(self):
+        first, second = object(), object()
+        droppy.set_app(first)
+        with droppy.using_app(second):
+            self.assertTrue(droppy.app() is second)
+            with droppy.using_app(None):
+                self.assertTrue(droppy.app() is None)
+            self.assertTrue(droppy.app() is second)
+        self.assertTrue(droppy.app() is first)
+
+    def test_using_app_is_greenlet_local(self):
+        first, second = object(), object()
+        droppy.set_app(first)
+        seen = []
+        def other():
+            seen.append(droppy.app())
+        with droppy.using_app(second):
+            gevent.spawn(other).join()
+            self.assertTrue(droppy.app() is second)
+        self.assertEquals(seen, [first])
+
+    def test_clear_app(self):
+        droppy.set_app(object())
+        droppy.set_app(None)
+        self.assertTrue(droppy.app() is None)
+        self.assertFalse(droppy._ONAPP.is_set())
+        a = object()
+        waiter = gevent.spawn(droppy.wait_for_app)
+        gevent.sleep(0)
+        self.assertFalse(waiter.ready())
+        droppy.set_app(a)
+        self.assertTrue(waiter.get(timeout=1) is a)
+
+
+class TestStartupProfile(unittest.TestCase):
+
+    def test_nested_phases(self):
+        ticks = iter([0.0, 1.0, 1.5, 3.0])
+        profile = StartupProfile(clock=lambda: next(ticks))
+        profile.add("import droppy", 0.25)
+        with profile.phase("initialize"):
+            with profile.phase("configure server"):
+                pass
+        self.assertEquals(profile.phases, [
+            (0, "import droppy", 0.25),
+            (0, "initialize", 3.0),
+            (1, "configure server", 0.5)])
+        out = StringIO()
+        profile.report(out)
+        self.assertTrue("    configure server" in out.getvalue())
+        self.assertTrue("3250.0 ms" in out.getvalue())
+
+
+class Recorder(Resource):
+    def __init__(self, closed):
+        self.closed = closed
+
+    def close(self):
+        self.closed.append(self)
+
+
+class TestResources(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = droppy.app()
+
+    def tearDown(self):
+        droppy.set_app(self.previous)
+
+    def test_close_order(self):
+        closed = []
+        app = droppy.Application("test")
+        first = app.add_resource("first", Recorder(closed))
+        tasks = app.add_resource("tasks", TaskQueue())
+        tasks.close = lambda: closed.append(tasks)
+        second = app.add_resource("second", Recorder(closed))
+        app.close_resources()
+        self.assertEquals(closed, [tasks, second, first])
+
+
+# Run in a fresh interpreter, the way a command line tool starts.
+_GREENLET_LOCAL_CHECK = """
+import sys
+sys.argv = ['app', 'check', '--profile-startup']
+import droppy
+from droppy.command import Subcommand
+
+class Check(Subcommand):
+    patch_gevent = True
+
+    def configure(self, parser):
+        pass
+
+    def run(self, app):
+        import bottle
+        import gevent
+
+        def handle(path):
+            bottle.request.bind({'PATH_INFO': path})
+            gevent.sleep(0.01)
+            return bottle.request.path
+
+        jobs = [gevent.spawn(handle, '/a'), gevent.spawn(handle, '/b')]
+        gevent.joinall(jobs)
+        phases = [name for depth, name, seconds in app._startup.phases]
+        sys.exit(0 if [j.value for j in jobs] == ['/a', '/b'] and
+                 'patch gevent' in phases else 1)
+
+class App(droppy.Application):
+    def initialize(self):
+        self.add_subcommand(Check('check', 'Check'))
+
+App('test').run()
+"""
+
+_LATE_IMPORT_CHECK = """
+import sys
+import droppy
+droppy.Application('test')._add_server_subcommand()
+droppy.DroppyConfiguration.load("")
+late = ['bottle', 'droppy.server.server', 'droppy.ratelimit', 'yaml']
+sys.exit(1 if [m for m in late if m in sys.modules] else 0)
+"""
+
+
+class TestServerPatching(unittest.TestCase):
+
+    def test_bottle_request_is_greenlet_local(self):
+        self.assertEquals(
+            subprocess.call([sys.executable, '-c', _GREENLET_LOCAL_CHECK]), 0)
+
+    def test_late_imports(self):
+        self.assertEquals(
+            subprocess.call([sys.executable, '-c', _LATE_IMPORT_CHECK]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import unittest
+
+import bottle
+import gevent
+
+from droppy.cache import LRUCache, cached, caches, watch_caches
+from tests.helpers import FakeClock
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(max_size=2, ttl=10, clock=self.clock)
+
+    def test_eviction(self):
+        self.cache.set('a', 'x')
+        self.cache.set('b', 'yy')
+        self.cache.get('a')
+        self.cache.set('c', 'zzz')
+        self.assertTrue('a' in self.cache)
+        self.assertFalse('b' in self.cache)
+        self.assertEquals(self.cache.evictions, 1)
+        self.assertEquals(self.cache.bytes, 4)
+
+    def test_expiry(self):
+        self.cache.set('a', 'x')
+        self.clock.now = 9.9
+        self.assertEquals(self.cache.get('a'), 'x')
+        self.clock.now = 10
+        self.assertEquals(self.cache.get('a'), None)
+        self.assertEquals(self.cache.bytes, 0)
+        self.assertEquals(self.cache.hit_ratio(), 0.5)
+
+    def test_coalesced_misses(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            gevent.sleep(0.01)
+            return 'value'
+
+        jobs = [gevent.spawn(self.cache.get_or_compute, 'k', compute)
+                for _ in range(5)]
+        gevent.joinall(jobs)
+        self.assertEquals([j.value for j in jobs], ['value'] * 5)
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(self.cache.coalesced, 4)
+
+    def test_error_propagates(self):
+        def compute():
+            gevent.sleep(0.01)
+            raise ValueError("boom")
+
+        jobs = [gevent.spawn(self.cache.get_or_compute, 'k', compute)
+                for _ in range(3)]
+        gevent.joinall(jobs)
+        for job in jobs:
+            self.assertTrue(isinstance(job.exception, ValueError))
+        self.assertFalse('k' in self.cache)
+
+
+class TestCachedRoute(unittest.TestCase):
+
+    def _request(self, path='/items', **headers):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path,
+                   'QUERY_STRING': ''}
+        for name, value in headers.iteritems():
+            environ['HTTP_' + name.upper()] = value
+        bottle.request.bind(environ)
+        bottle.response.bind()
+
+    def test_cached_with_etag(self):
+        calls = []
+
+        @cached(ttl=60, name='test.items')
+        def items():
+            calls.append(1)
+            return {'items': [1, 2]}
+
+        self._request()
+        body = items()
+        etag = bottle.response.headers['ETag']
+        self.assertEquals(body, '{"items": [1, 2]}')
+        self.assertEquals(bottle.response.content_type, 'application/json')
+        self._request()
+        self.assertEquals(items(), body)
+        self.assertEquals(len(calls), 1)
+        self._request(if_none_match=etag)
+        self.assertEquals(items().status_code, 304)
+        self.assertEquals(caches()['test.items'].hits, 2)
+
+    def test_error_not_cached(self):
+        @cached(ttl=60)
+        def missing():
+            bottle.response.status = 404
+            return "missing"
+
+        self._request()
+        self.assertEquals(missing(), "missing")
+        self.assertEquals(len(missing.cache), 0)
+
+    def test_watch_caches(self):
+        seen = []
+        watch_caches(seen.append)
+        existing = len(seen)
+        for _ in range(2):
+            cached(ttl=60, name='test.watched')(lambda: "x")
+        self.assertEquals(seen[existing:], ['test.watched'])
+        self.assertEquals(len(seen), len(caches()))
+
+
+if __name__ == "__main__":
+    unittest.main()
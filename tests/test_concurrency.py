@@ -0,0 +1,151 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import unittest
+
+import bottle
+import gevent
+
+from droppy.concurrency import SingleFlight, within, remaining, cap_timeout
+from droppy.concurrency import spawn_with_deadline
+from droppy.server.timeouts import RequestTimeoutPlugin
+from droppy.metrics import MetricsRegistry
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.flight = SingleFlight(self.registry, "lookups")
+
+    def test_shares_result(self):
+        calls = []
+
+        def lookup(n):
+            calls.append(n)
+            gevent.sleep(0.01)
+            return n * 2
+
+        jobs = [gevent.spawn(self.flight.do, 'k', lookup, 21)
+                for _ in range(10)]
+        gevent.joinall(jobs)
+        self.assertEquals([j.value for j in jobs], [42] * 10)
+        self.assertEquals(calls, [21])
+        self.assertEquals(self.registry.counter("lookups.calls").count, 1)
+        self.assertEquals(self.registry.counter("lookups.coalesced").count, 9)
+        self.assertEquals(len(self.flight), 0)
+
+    def test_keys_are_independent(self):
+        jobs = [gevent.spawn(self.flight.do, k, gevent.sleep, 0.01)
+                for k in ('a', 'b')]
+        gevent.joinall(jobs)
+        self.assertEquals(self.flight.calls.count, 2)
+        self.assertEquals(self.flight.coalesced.count, 0)
+
+    def test_error_propagates(self):
+        def fail():
+            gevent.sleep(0.01)
+            raise KeyError('missing')
+
+        jobs = [gevent.spawn(self.flight.do, 'k', fail) for _ in range(3)]
+        gevent.joinall(jobs)
+        for job in jobs:
+            self.assertTrue(isinstance(job.exception, KeyError))
+        self.assertEquals(self.flight.errors.count, 1)
+
+    def test_interrupted_call_not_shared(self):
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            gevent.sleep(0.02)
+            return 'value'
+
+        def leader():
+            with gevent.Timeout(0.01):
+                self.flight.do('k', lookup)
+
+        first = gevent.spawn(leader)
+        gevent.sleep(0)
+        waiter = gevent.spawn(self.flight.do, 'k', lookup)
+        gevent.joinall([first, waiter])
+        self.assertTrue(isinstance(first.exception, gevent.Timeout))
+        self.assertEquals(waiter.value, 'value')
+        self.assertEquals(len(calls), 2)
+
+    def test_not_cached(self):
+        self.assertEquals(self.flight.do('k', lambda: 1), 1)
+        self.assertEquals(self.flight.do('k', lambda: 2), 2)
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_no_deadline(self):
+        self.assertEquals(remaining(), None)
+        self.assertEquals(cap_timeout(5), 5)
+
+    def test_within(self):
+        with within(10):
+            self.assertTrue(9 < remaining() <= 10)
+            self.assertEquals(cap_timeout(1), 1)
+            self.assertTrue(cap_timeout(60) <= 10)
+            with within(60):
+                self.assertTrue(remaining() <= 10)
+        self.assertEquals(remaining(), None)
+
+    def test_timeout(self):
+        try:
+            with within(0.01) as timer:
+                gevent.sleep(1)
+            self.fail("Expected a timeout")
+        except gevent.Timeout as e:
+            self.assertTrue(e is timer)
+
+    def test_spawn_inherits(self):
+        with within(0.01):
+            job = spawn_with_deadline(gevent.sleep, 1)
+            other = spawn_with_deadline(remaining)
+        job.join()
+        other.join()
+        self.assertTrue(isinstance(job.exception, gevent.Timeout))
+        self.assertTrue(other.value <= 0.01)
+
+
+class TestRequestTimeoutPlugin(unittest.TestCase):
+
+    def _apply(self, callback, **config):
+        route = bottle.Route(bottle.Bottle(), '/slow', 'GET', callback,
+                             **config)
+        self.plugin = RequestTimeoutPlugin(0.01)
+        return self.plugin.apply(callback, route)
+
+    def test_times_out(self):
+        wrapped = self._apply(lambda: gevent.sleep(1))
+        try:
+            wrapped()
+            self.fail("Expected a 503")
+        except bottle.HTTPResponse as e:
+            self.assertEquals(e.status_code, 503)
+        self.assertEquals(self.plugin.timed_out.count, 1)
+
+    def test_route_opts_out(self):
+        callback = lambda: "ok"
+        self.assertTrue(self._apply(callback, request_timeout=0) is callback)
+
+
+if __name__ == "__main__":
+    unittest.main()
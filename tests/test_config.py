@@ -15,15 +15,22 @@
 ##  limitations under the License.
 ##
 ###############################################################################
+import os
+import sys
+import shutil
+import tempfile
 import unittest
 import os.path as op
 
 from droppy.config import Configuration, load_configuration
-from droppy.config import ConfigurationException
-from droppy.validation import Int, String, Regex
+from droppy.config import ConfigurationException, ConfigurationCache
+from droppy.config import ConfigurationWatcher, DroppyConfiguration
+from droppy.config.cache import schema_files
+from droppy.validation import Int, String, Regex, FrozenDocument
 
 
 _in_cfg = lambda *x:op.join(op.dirname(__file__), 'config', *x)
+_source = lambda module: op.splitext(module.__file__)[0] + '.py'
 
 class MyConfig(Configuration):
     @Int()
@@ -85,6 +92,104 @@ class TestLoading(unittest.TestCase):
                           MyConfig, filename)
 
 
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ConfigurationCache(op.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached(self):
+        filename = _in_cfg("myconfig.yaml")
+        first = load_configuration(MyConfig, filename, self.cache)
+        self.assertEquals(len(os.listdir(self.cache.directory)), 1)
+        second = load_configuration(MyConfig, filename, self.cache)
+        self.assertTrue(isinstance(second, MyConfig))
+        self.assertEquals(second.some_value, 10)
+        self.assertEquals(second.another, first.another)
+
+    def test_content_change(self):
+        self.cache.load(MyConfig, "some_value: 1")
+        result = self.cache.load(MyConfig, "some_value: 2")
+        self.assertEquals(result.some_value, 2)
+        self.assertEquals(len(os.listdir(self.cache.directory)), 2)
+
+    def test_corrupt_entry(self):
+        self.cache.load(MyConfig, "some_value: 3")
+        for name in os.listdir(self.cache.directory):
+            with open(op.join(self.cache.directory, name), 'w') as f:
+                f.write("garbage")
+        self.assertEquals(self.cache.load(MyConfig, "some_value: 3").some_value,
+                          3)
+
+    def test_invalid_not_cached(self):
+        filename = _in_cfg("myconfig.yaml")
+        self.assertRaises(ConfigurationException, load_configuration,
+                          BadConfig, filename, self.cache)
+        self.assertFalse(op.exists(self.cache.directory))
+
+    def test_schema_files(self):
+        import formencode.validators
+        import droppy.validation.validators
+        files = schema_files(MyConfig)
+        self.assertTrue(_source(sys.modules[__name__]) in files)
+        self.assertTrue(_source(droppy.validation.validators) in files)
+        self.assertTrue(_source(formencode.validators) in files)
+
+    def test_unsafe_directory(self):
+        os.mkdir(self.cache.directory)
+        os.chmod(self.cache.directory, 0o777)
+        self.assertEquals(self.cache.load(MyConfig, "some_value: 4").some_value,
+                          4)
+        self.assertEquals(os.listdir(self.cache.directory), [])
+        os.chmod(self.cache.directory, 0o700)
+        self.cache.load(MyConfig, "some_value: 4")
+        self.assertEquals(len(os.listdir(self.cache.directory)), 1)
+
+
+class TestWatcher(unittest.TestCase):
+
+    def test_reload(self):
+        changes = []
+        watcher = ConfigurationWatcher(
+            _in_cfg("myconfig.yaml"),
+            lambda f: load_configuration(MyConfig, f), changes.append)
+        self.assertTrue(watcher.reload())
+        self.assertEquals(changes[0].some_value, 10)
+
+    def test_invalid_keeps_current(self):
+        changes = []
+        watcher = ConfigurationWatcher(
+            _in_cfg("myconfig.yaml"),
+            lambda f: load_configuration(BadConfig, f), changes.append)
+        self.assertFalse(watcher.reload())
+        self.assertEquals(changes, [])
+
+
+class TestFreeze(unittest.TestCase):
+
+    def test_values(self):
+        config = load_configuration(MyConfig, _in_cfg("myconfig.yaml"))
+        frozen = config.freeze()
+        self.assertEquals(frozen.some_value, 10)
+        self.assertEquals(frozen.another, config.another)
+        self.assertEquals(frozen._asdict(),
+                          {'some_value': 10, 'another': config.another})
+
+    def test_immutable(self):
+        frozen = MyConfig.default().freeze()
+        self.assertRaises(AttributeError, setattr, frozen, 'some_value', 2)
+        self.assertRaises(AttributeError, setattr, frozen, 'other', 2)
+        self.assertFalse(hasattr(frozen, '__dict__'))
+
+    def test_nested(self):
+        frozen = DroppyConfiguration.default().freeze()
+        self.assertTrue(isinstance(frozen.http, FrozenDocument))
+        self.assertEquals(frozen.http.port, DroppyConfiguration.default().http.port)
+        self.assertEquals(frozen, DroppyConfiguration.default().freeze())
+
 
 if __name__ == "__main__":
     unittest.main()
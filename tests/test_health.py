@@ -0,0 +1,104 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import unittest
+
+import gevent
+
+from droppy.health import HealthCheck, HealthCheckRegistry, Result
+from tests.helpers import FakeClock
+
+
+class CountingCheck(HealthCheck):
+    def __init__(self, result=None):
+        self.calls = 0
+        self.result = result
+
+    def check(self):
+        self.calls += 1
+        return self.result
+
+
+class BrokenCheck(HealthCheck):
+    def check(self):
+        raise IOError("connection refused")
+
+
+class SlowCheck(HealthCheck):
+    timeout = 0.01
+
+    def check(self):
+        gevent.sleep(1)
+
+
+class TestHealthChecks(unittest.TestCase):
+
+    def test_results(self):
+        registry = HealthCheckRegistry()
+        registry.register("ok", CountingCheck())
+        registry.register("bad", CountingCheck(Result.failed("no disk")))
+        registry.register("broken", BrokenCheck())
+        registry.register("slow", SlowCheck())
+        results = registry.run_checks()
+        self.assertTrue(results["ok"].healthy)
+        self.assertFalse(results["bad"].healthy)
+        self.assertEquals(results["bad"].message, "no disk")
+        self.assertFalse(results["broken"].healthy)
+        self.assertFalse(results["slow"].healthy)
+        self.assertFalse(registry.is_healthy())
+
+    def test_duplicate(self):
+        registry = HealthCheckRegistry()
+        registry.register("ok", CountingCheck())
+        self.assertRaises(ValueError, registry.register, "ok", CountingCheck())
+
+    def test_cached(self):
+        clock = FakeClock(1000.0)
+        check = CountingCheck()
+        registry = HealthCheckRegistry(ttl=5, clock=clock)
+        registry.register("ok", check)
+        registry.run_checks()
+        registry.run_checks()
+        self.assertEquals(check.calls, 1)
+        clock.now += 6
+        registry.run_checks()
+        self.assertEquals(check.calls, 2)
+
+    def test_concurrent_callers_share_a_run(self):
+        check = CountingCheck()
+        registry = HealthCheckRegistry(ttl=0)
+        registry.register("ok", check)
+        callers = [gevent.spawn(registry.run_checks) for i in xrange(5)]
+        gevent.joinall(callers)
+        self.assertEquals(check.calls, 1)
+        self.assertTrue(all(g.value["ok"].healthy for g in callers))
+
+    def test_enclosing_timeout_propagates(self):
+        check = SlowCheck()
+        check.timeout = 5
+        outer = gevent.Timeout(0.01)
+        with outer:
+            try:
+                check.execute()
+            except gevent.Timeout as t:
+                self.assertTrue(t is outer)
+            else:
+                self.fail("the enclosing timeout was swallowed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import unittest
+
+import bottle
+
+from droppy.metrics import MetricsRegistry, Meter, Histogram, Timer
+from droppy.metrics import to_dict, to_prometheus, RouteMetricsPlugin
+from tests.helpers import FakeClock
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        registry = MetricsRegistry()
+        registry.counter("requests").inc()
+        registry.counter("requests").inc(2)
+        registry.counter("requests").dec()
+        self.assertEquals(registry.counter("requests").count, 2)
+
+    def test_gauge(self):
+        registry = MetricsRegistry()
+        registry.gauge("answer", lambda: 42)
+        self.assertEquals(registry.gauge("answer").value(), 42)
+
+    def test_wrong_type(self):
+        registry = MetricsRegistry()
+        registry.counter("thing")
+        self.assertRaises(ValueError, registry.timer, "thing")
+
+    def test_labels(self):
+        registry = MetricsRegistry()
+        registry.counter("hits", route="/a").inc()
+        registry.counter("hits", route="/b").inc(5)
+        self.assertEquals(registry.counter("hits", route="/a").count, 1)
+        self.assertEquals(to_dict(registry),
+                          {'hits{route=/a}': 1, 'hits{route=/b}': 5})
+
+    def test_registry_labels(self):
+        registry = MetricsRegistry(worker="12")
+        registry.counter("hits", route="/a").inc()
+        self.assertEquals(to_dict(registry), {'hits{route=/a,worker=12}': 1})
+        self.assertTrue('hits{route="/a",worker="12"} 1'
+                        in to_prometheus(registry))
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram()
+        for i in xrange(1, 101):
+            histogram.update(i)
+        snapshot = histogram.snapshot()
+        self.assertEquals(histogram.count, 100)
+        self.assertEquals(histogram.min, 1)
+        self.assertEquals(histogram.max, 100)
+        self.assertAlmostEquals(snapshot.median, 50.5)
+        self.assertAlmostEquals(snapshot.percentile(0.99), 99.99)
+
+    def test_histogram_is_bounded(self):
+        histogram = Histogram(size=10)
+        for i in xrange(1000):
+            histogram.update(i)
+        self.assertEquals(len(histogram.snapshot()), 10)
+        self.assertEquals(histogram.count, 1000)
+        self.assertEquals(histogram.max, 999)
+
+    def test_histogram_favours_recent_values(self):
+        clock = FakeClock(1000.0)
+        histogram = Histogram(size=100, clock=clock)
+        for _ in xrange(1000):
+            histogram.update(1)
+        clock.now += 600
+        for _ in xrange(1000):
+            histogram.update(100)
+        snapshot = histogram.snapshot()
+        self.assertEquals(snapshot.median, 100)
+        self.assertEquals(histogram.min, 1)
+
+    def test_histogram_rescales(self):
+        clock = FakeClock(1000.0)
+        histogram = Histogram(size=10, clock=clock)
+        for i in xrange(100):
+            clock.now += Histogram.RESCALE_INTERVAL / 10
+            histogram.update(i)
+        self.assertEquals(len(histogram.snapshot()), 10)
+        self.assertTrue(min(histogram.snapshot().values) >= 80)
+
+    def test_meter_rates(self):
+        clock = FakeClock(1000.0)
+        meter = Meter(clock)
+        meter.mark(50)
+        clock.now += 5
+        self.assertAlmostEquals(meter.m1_rate, 10.0)
+        self.assertAlmostEquals(meter.mean_rate, 10.0)
+        clock.now += 60
+        self.assertTrue(meter.m1_rate < meter.m15_rate)
+
+    def test_timer(self):
+        clock = FakeClock(1000.0)
+        timer = Timer(clock)
+        with timer.time():
+            clock.now += 0.25
+        self.assertEquals(timer.count, 1)
+        self.assertAlmostEquals(timer.snapshot().median, 0.25)
+
+    def test_prometheus(self):
+        registry = MetricsRegistry()
+        registry.counter("jobs.done", queue="email").inc(3)
+        registry.histogram("sizes").update(7)
+        output = to_prometheus(registry)
+        self.assertTrue('# TYPE jobs_done gauge' in output)
+        self.assertTrue('jobs_done{queue="email"} 3' in output)
+        self.assertTrue('# TYPE sizes summary' in output)
+        self.assertTrue('sizes{quantile="0.5"} 7' in output)
+        self.assertTrue('sizes_count 1' in output)
+
+
+class TestRouteMetricsPlugin(unittest.TestCase):
+
+    def setUp(self):
+        bottle.response.bind()
+        self.registry = MetricsRegistry()
+        self.plugin = RouteMetricsPlugin(self.registry)
+
+    def _apply(self, callback):
+        route = bottle.Route(bottle.Bottle(), '/items/<id>', 'GET', callback)
+        return self.plugin.apply(callback, route)
+
+    def test_success(self):
+        wrapped = self._apply(lambda id: "item " + id)
+        self.assertEquals(wrapped("1"), "item 1")
+        self.assertEquals(wrapped(id="2"), "item 2")
+        labels = {'method': 'GET', 'route': '/items/<id>'}
+        self.assertEquals(
+            self.registry.timer("droppy.requests.latency", **labels).count, 2)
+        self.assertEquals(
+            self.registry.counter("droppy.requests.active", **labels).count, 0)
+        self.assertEquals(self.registry.counter(
+            "droppy.requests.responses", status=200, **labels).count, 2)
+
+    def test_error(self):
+        def callback(id):
+            raise bottle.HTTPError(404)
+        wrapped = self._apply(callback)
+        self.assertRaises(bottle.HTTPError, wrapped, "1")
+        self.assertEquals(self.registry.counter(
+            "droppy.requests.responses", status=404, method='GET',
+            route='/items/<id>').count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import os
+import time
+import unittest
+
+import bottle
+import gevent
+
+from droppy.config import DroppyConfiguration
+from droppy.ratelimit import BucketTable, SharedBucketTable, RateLimitPlugin
+from tests.helpers import FakeClock
+
+
+class TestBucketTable(unittest.TestCase):
+    table_class = BucketTable
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.table = self.table_class(rate=2, burst=3, max_keys=64,
+                                      clock=self.clock)
+
+    def test_burst_then_refill(self):
+        self.assertEquals([self.table.consume('a') for _ in range(3)],
+                          [0, 0, 0])
+        self.assertAlmostEqual(self.table.consume('a'), 0.5)
+        self.assertEquals(self.table.consume('b'), 0)
+        self.clock.now += 0.5
+        self.assertEquals(self.table.consume('a'), 0)
+        self.assertTrue(self.table.consume('a') > 0)
+
+
+class TestSharedBucketTable(TestBucketTable):
+    table_class = SharedBucketTable
+
+    def test_shared_across_fork(self):
+        self.table.consume('a')
+        pid = os.fork()
+        if pid == 0:
+            self.table.consume('a')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEquals(self.table.consume('a'), 0)
+        self.assertTrue(self.table.consume('a') > 0)
+
+    def test_dead_lock_holder_fails_over(self):
+        self.table.lock_timeout = 0.01
+        self.table.retry_after = 0.05
+        self.table._lock.acquire()
+        self.assertEquals(self.table.consume('a'), 0)
+        self.assertTrue(isinstance(self.table._local, BucketTable))
+        self.table._lock.release()
+        self.assertEquals(self.table.consume('a'), 0)
+        self.assertTrue(self.table._local is not None)
+        time.sleep(0.05)
+        self.assertEquals(self.table.consume('a'), 0)
+        self.assertTrue(self.table._local is None)
+
+    def test_waiting_for_the_lock_yields(self):
+        self.table.lock_timeout = 1
+        self.table._lock.acquire()
+        ran = []
+        def other():
+            ran.append(1)
+            self.table._lock.release()
+        gevent.spawn(other)
+        self.assertEquals(self.table.consume('a'), 0)
+        self.assertEquals(ran, [1])
+        self.assertTrue(self.table._local is None)
+
+
+class TestEviction(unittest.TestCase):
+
+    def test_idle_keys_evicted(self):
+        clock = FakeClock(1000.0)
+        table = BucketTable(rate=1, burst=1, max_keys=10, clock=clock)
+        for i in range(10):
+            table.consume(i)
+        clock.now += 2
+        table.consume('new')
+        self.assertEquals(len(table), 1)
+
+    def test_active_keys_evicted_in_batches(self):
+        clock = FakeClock(1000.0)
+        table = BucketTable(rate=1, burst=5, max_keys=10, clock=clock)
+        for i in range(11):
+            table.consume(i)
+            clock.now += 0.01
+        # Down to 90%, giving up the keys closest to full.
+        self.assertEquals(len(table), 9)
+        self.assertEquals(table.consume(10), 0)
+        self.assertEquals(len(table), 9)
+
+
+class TestRateLimitPlugin(unittest.TestCase):
+
+    def _request(self, **environ):
+        environ.setdefault('REQUEST_METHOD', 'GET')
+        environ.setdefault('REMOTE_ADDR', '10.0.0.1')
+        bottle.request.bind(environ)
+
+    def _apply(self, **settings):
+        settings.setdefault('rate', 1)
+        settings.setdefault('burst', 1)
+        config = DroppyConfiguration.load({'rateLimit': settings}).rateLimit
+        plugin = RateLimitPlugin(config)
+        route = bottle.Route(bottle.Bottle(), '/items', 'GET', lambda: "ok")
+        return plugin, plugin.apply(route.callback, route)
+
+    def test_limits_by_ip(self):
+        plugin, wrapped = self._apply()
+        self._request()
+        self.assertEquals(wrapped(), "ok")
+        try:
+            wrapped()
+            self.fail("Expected a 429")
+        except bottle.HTTPResponse as e:
+            self.assertEquals(e.status_code, 429)
+            self.assertEquals(e.headers['Retry-After'], '1')
+        self._request(REMOTE_ADDR='10.0.0.2')
+        self.assertEquals(wrapped(), "ok")
+        self.assertEquals(plugin.rejected.count, 1)
+
+    def test_limits_by_api_key(self):
+        plugin, wrapped = self._apply(key='apiKey')
+        self._request(HTTP_X_API_KEY='one')
+        self.assertEquals(wrapped(), "ok")
+        self._request(HTTP_X_API_KEY='two')
+        self.assertEquals(wrapped(), "ok")
+        self.assertRaises(bottle.HTTPResponse, wrapped)
+
+    def test_forwarded_for_trusts_only_proxy_entries(self):
+        plugin, wrapped = self._apply(trustedProxies=1)
+        self._request(HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.9')
+        self.assertEquals(wrapped(), "ok")
+        # A spoofed leftmost entry doesn't get a fresh bucket.
+        self._request(HTTP_X_FORWARDED_FOR='2.2.2.2, 10.0.0.9')
+        self.assertRaises(bottle.HTTPResponse, wrapped)
+        self._request(HTTP_X_FORWARDED_FOR='10.0.0.8')
+        self.assertEquals(wrapped(), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import socket
+import unittest
+
+import gevent
+from gevent import pywsgi
+
+from droppy.metrics import MetricsRegistry
+from droppy.resources import ConnectionPool, PoolExhausted, HTTPClientPool
+from tests.helpers import FakeClock
+
+
+class FakeConnection(object):
+    def __init__(self, n):
+        self.n = n
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.made = []
+        self.clock = FakeClock()
+        self.pool = ConnectionPool(self._connect, max_size=2,
+                                   idle_timeout=10, acquire_timeout=0.01,
+                                   clock=self.clock)
+
+    def _connect(self):
+        conn = FakeConnection(len(self.made))
+        self.made.append(conn)
+        return conn
+
+    def test_reuse(self):
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            self.assertTrue(second is first)
+        self.assertEquals(len(self.made), 1)
+        self.assertEquals((self.pool.in_use, self.pool.idle), (0, 1))
+
+    def test_bounded(self):
+        self.pool.acquire()
+        self.pool.acquire()
+        self.assertRaises(PoolExhausted, self.pool.acquire)
+        self.assertEquals(self.pool.timeouts, 1)
+
+    def test_waits_for_release(self):
+        conns = [self.pool.acquire(), self.pool.acquire()]
+        gevent.spawn_later(0.001, self.pool.release, conns[0])
+        self.assertTrue(self.pool.acquire() is conns[0])
+
+    def test_discard_on_error(self):
+        try:
+            with self.pool.connection():
+                raise IOError("broken")
+        except IOError:
+            pass
+        self.assertTrue(self.made[0].closed)
+        self.assertEquals(self.pool.open, 0)
+
+    def test_reap_idle(self):
+        a, b = self.pool.acquire(), self.pool.acquire()
+        self.pool.release(a)
+        self.clock.now = 5
+        self.pool.release(b)
+        self.clock.now = 12
+        self.pool.reap()
+        self.assertTrue(a.closed)
+        self.assertFalse(b.closed)
+        self.assertEquals(self.pool.idle, 1)
+
+    def test_close(self):
+        conn = self.pool.acquire()
+        with self.pool.connection():
+            pass
+        self.pool.close()
+        self.assertTrue(self.made[1].closed)
+        self.pool.release(conn)
+        self.assertTrue(conn.closed)
+        self.assertRaises(PoolExhausted, self.pool.acquire)
+
+    def test_health_and_metrics(self):
+        self.pool.probe = lambda conn: False
+        self.assertFalse(self.pool.execute(1).healthy)
+        self.pool.probe = lambda conn: True
+        self.assertTrue(self.pool.execute(1).healthy)
+        self.assertEquals(self.pool.open, 0)
+        self.assertTrue(all(conn.closed for conn in self.made))
+        registry = MetricsRegistry()
+        self.pool.register_metrics(registry, "db")
+        self.assertEquals(registry.get("droppy.resources.pool.created",
+                                       pool="db").value(), 0)
+
+    def test_health_when_exhausted(self):
+        self.pool.acquire()
+        self.pool.acquire()
+        self.assertTrue(self.pool.execute(1).healthy)
+
+
+class TestHTTPClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        def application(environ, start_response):
+            self.calls.append(environ['REQUEST_METHOD'])
+            if environ['PATH_INFO'] == '/slow':
+                gevent.sleep(0.2)
+            start_response("200 OK", [('Content-Type', 'text/plain')])
+            return ["hello"]
+        self.server = pywsgi.WSGIServer(('127.0.0.1', 0), application,
+                                        log=None)
+        self.server.start()
+        self.pool = HTTPClientPool(
+            "http://127.0.0.1:{0}".format(self.server.server_port))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_reuses_connection(self):
+        self.assertEquals(self.pool.request('GET', '/')[2], "hello")
+        self.assertEquals(self.pool.request('GET', '/')[2], "hello")
+        self.assertEquals(self.pool.created, 1)
+
+    def test_retries_stale_connection(self):
+        self.pool.request('GET', '/')
+        # As if the server had dropped the connection while it sat idle.
+        self.pool._idle[-1][1].sock.close()
+        status, headers, body = self.pool.request('GET', '/')
+        self.assertEquals((status, body), (200, "hello"))
+        self.assertEquals(self.pool.created, 2)
+        self.assertEquals(self.pool.open, 1)
+
+    def test_does_not_retry_post(self):
+        self.pool.request('GET', '/')
+        self.pool._idle[-1][1].sock.close()
+        self.assertRaises(socket.error, self.pool.request, 'POST', '/', "x")
+        self.assertEquals(self.pool.created, 1)
+        self.assertEquals(self.pool.open, 0)
+
+    def test_does_not_retry_timeout(self):
+        self.pool.request('GET', '/')
+        self.assertRaises(socket.timeout, self.pool.request, 'GET', '/slow',
+                          timeout=0.05)
+        gevent.sleep(0.3)
+        self.assertEquals(self.calls, ['GET', 'GET'])
+        self.assertEquals(self.pool.created, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,258 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import time
+import signal
+import unittest
+
+import gevent
+from gevent import socket
+from gevent.pool import Pool
+
+from droppy.config import ConfigurationException
+from droppy.server.server import ServerFarm
+from droppy.server import backends
+from droppy.server.backends import get_backend, register_backend
+from droppy.server.backends import backend_names, gevent_wsgi, gevent_pywsgi
+from droppy.server.admission import AdmissionController
+from droppy.server.profiling import SamplingProfiler, ProfilerBusy
+from droppy.server.profiling import dump_greenlets
+
+
+class FakeSocket(object):
+    def dup(self):
+        return FakeSocket()
+
+
+class FakeServer(object):
+    def __init__(self, socket=None):
+        self.socket = socket or FakeSocket()
+        self.spawn = None
+        self.started = False
+        self.stopped = False
+
+    def set_spawn(self, spawn):
+        self.spawn = spawn
+
+    def start(self):
+        self.started = True
+
+    def stop(self, timeout=None):
+        self.stopped = True
+
+    def close(self):
+        self.stopped = True
+
+
+class TestServerFarm(unittest.TestCase):
+
+    def test_separate_pools(self):
+        farm = ServerFarm()
+        main, admin = FakeServer(), FakeServer()
+        farm.add(main, size=5, name="main")
+        farm.add(admin, size=2, name="admin")
+        self.assertTrue(main.spawn is not admin.spawn)
+        self.assertEquals(farm.occupancy(), {'main': (0, 5), 'admin': (0, 2)})
+
+    def test_shared_pool(self):
+        farm = ServerFarm(3)
+        first, second = FakeServer(), FakeServer()
+        farm.add(first)
+        farm.add(second)
+        self.assertTrue(first.spawn is farm.pool)
+        self.assertTrue(second.spawn is farm.pool)
+
+    def test_reload(self):
+        farm = ServerFarm()
+        old = FakeServer()
+        farm.add(old, size=5, name="main", factory=FakeServer)
+        farm.start()
+        farm.reload(timeout=0)
+        new = farm.servers[0]
+        self.assertTrue(new is not old)
+        self.assertTrue(new.socket is not old.socket)
+        self.assertTrue(new.started)
+        self.assertTrue(new.spawn is not old.spawn)
+        farm.stop(timeout=0)
+        self.assertTrue(old.stopped)
+        self.assertTrue(new.stopped)
+        self.assertEquals(farm.occupancy(), {'main': (0, 5)})
+
+    def test_stop_callbacks(self):
+        farm = ServerFarm()
+        server = FakeServer()
+        farm.add(server)
+        calls = []
+        farm.on_stop(lambda: calls.append(server.stopped))
+        farm.start()
+        farm.stop(timeout=0)
+        self.assertEquals(calls, [True])
+
+
+def busy_loop(until):
+    while time.time() < until:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_profile(self):
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        try:
+            self.assertRaises(ProfilerBusy, SamplingProfiler().start)
+            busy_loop(time.time() + 0.2)
+        finally:
+            profiler.stop()
+        self.assertTrue(profiler.samples > 0)
+        self.assertTrue('busy_loop' in profiler.collapsed())
+
+    def test_restores_handler(self):
+        previous = signal.getsignal(signal.SIGPROF)
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        profiler.stop()
+        self.assertEquals(signal.getsignal(signal.SIGPROF), previous)
+
+    def test_dump_greenlets(self):
+        pool = Pool()
+        waiting = pool.spawn(gevent.sleep, 10)
+        gevent.sleep(0)
+        try:
+            dump = dump_greenlets({'main': pool})
+        finally:
+            waiting.kill()
+        self.assertTrue('[pool: main]' in dump)
+        self.assertTrue('test_dump_greenlets' in dump)
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def _app(self, delay):
+        def application(environ, start_response):
+            gevent.sleep(delay)
+            start_response("200 OK", [])
+            return ["ok"]
+        return application
+
+    def _call(self, controller):
+        statuses = []
+        controller({}, lambda status, headers: statuses.append(
+            (status, dict(headers))))
+        return statuses[0]
+
+    def test_sheds_beyond_queue(self):
+        controller = AdmissionController(self._app(0.05), limit=2,
+                                         max_queue=1, interval=1)
+        jobs = [gevent.spawn(self._call, controller) for _ in range(5)]
+        gevent.joinall(jobs)
+        statuses = [j.value[0] for j in jobs]
+        self.assertEquals(statuses.count("200 OK"), 3)
+        self.assertEquals(statuses.count("503 Service Unavailable"), 2)
+        self.assertEquals(jobs[-1].value[1]['Retry-After'], '1')
+        self.assertEquals(controller.rejected.count, 2)
+        self.assertEquals((controller.active, controller.queued), (0, 0))
+
+    def test_queue_timeout(self):
+        controller = AdmissionController(self._app(0.1), limit=1,
+                                         max_queue=10, interval=0.02)
+        jobs = [gevent.spawn(self._call, controller) for _ in range(2)]
+        gevent.joinall(jobs)
+        self.assertEquals([j.value[0] for j in jobs],
+                          ["200 OK", "503 Service Unavailable"])
+
+    def test_draining_queue_keeps_interval(self):
+        # Always one request running and one waiting, but the queue empties
+        # at every hand-over, so waiters must keep the full interval.
+        controller = AdmissionController(self._app(0.02), limit=1,
+                                         max_queue=1, target=0.005,
+                                         interval=0.05)
+        def client():
+            return [self._call(controller)[0] for _ in range(5)]
+        jobs = [gevent.spawn(client) for _ in range(2)]
+        gevent.joinall(jobs)
+        self.assertEquals([j.value for j in jobs], [["200 OK"] * 5] * 2)
+        self.assertEquals(controller.rejected.count, 0)
+
+    def test_resize_admits_waiters(self):
+        controller = AdmissionController(self._app(0.05), limit=1,
+                                         max_queue=10, interval=1)
+        jobs = [gevent.spawn(self._call, controller) for _ in range(3)]
+        gevent.sleep(0)
+        self.assertEquals(controller.queued, 2)
+        controller.resize(3)
+        self.assertEquals((controller.active, controller.queued), (3, 0))
+        gevent.joinall(jobs)
+        self.assertEquals(controller.active, 0)
+
+
+class FakeHttpConfig(object):
+    def __init__(self, keepAlive=True, maxAccept=100):
+        self.keepAlive = keepAlive
+        self.maxAccept = maxAccept
+
+
+class TestBackends(unittest.TestCase):
+
+    def _app(self, environ, start_response):
+        start_response("200 OK", [])
+        return ["ok"]
+
+    def test_builtin(self):
+        self.assertTrue(get_backend('gevent') is gevent_wsgi)
+        self.assertTrue(get_backend('pywsgi') is gevent_pywsgi)
+
+    def test_unknown(self):
+        self.assertRaises(ConfigurationException, get_backend, 'tornado')
+
+    def test_register(self):
+        factory = lambda listener, application, config: None
+        register_backend('custom', factory)
+        try:
+            self.assertTrue(get_backend('custom') is factory)
+            self.assertTrue('custom' in backend_names())
+        finally:
+            del backends._BACKENDS['custom']
+
+    def test_pywsgi(self):
+        server = gevent_pywsgi(('127.0.0.1', 0), self._app,
+                               FakeHttpConfig(maxAccept=7))
+        self.assertEquals(server.max_accept, 7)
+        self.assertTrue(hasattr(server, 'set_spawn'))
+
+    def test_pywsgi_without_keep_alive(self):
+        server = gevent_pywsgi(('127.0.0.1', 0), self._app,
+                               FakeHttpConfig(keepAlive=False))
+        server.start()
+        try:
+            sock = socket.create_connection(server.address)
+            sock.sendall("GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = ''
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                response += data
+            sock.close()
+        finally:
+            server.stop()
+        self.assertTrue(response.startswith("HTTP/1.1 200 OK"))
+        self.assertTrue("Connection: close" in response)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+###############################################################################
+##
+##  Copyright 2013 Ian McCracken
+##
+##  Licensed under the Apache License, Version 2.0 (the "License");
+##  you may not use this file except in compliance with the License.
+##  You may obtain a copy of the License at
+##
+##      http://www.apache.org/licenses/LICENSE-2.0
+##
+##  Unless required by applicable law or agreed to in writing, software
+##  distributed under the License is distributed on an "AS IS" BASIS,
+##  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+##  See the License for the specific language governing permissions and
+##  limitations under the License.
+##
+###############################################################################
+import unittest
+
+import gevent
+from gevent.event import Event
+
+from droppy.metrics import MetricsRegistry
+from droppy.tasks import TaskQueue, QueueFull
+
+
+class TestTaskQueue(unittest.TestCase):
+
+    def test_runs_tasks(self):
+        tasks = TaskQueue(size=10, concurrency=2)
+        done = []
+        for i in range(5):
+            self.assertTrue(tasks.submit(done.append, i))
+        tasks.close()
+        self.assertEquals(sorted(done), range(5))
+        self.assertEquals(tasks.latency.count, 5)
+
+    def _blocked(self, **kwargs):
+        # A queue whose only worker is stuck until release is set.
+        release = Event()
+        tasks = TaskQueue(size=2, concurrency=1, **kwargs)
+        tasks.submit(release.wait)
+        gevent.sleep(0)
+        return tasks, release
+
+    def test_drop(self):
+        tasks, release = self._blocked(overflow='drop')
+        done = []
+        results = [tasks.submit(done.append, i) for i in range(3)]
+        self.assertEquals(results, [True, True, False])
+        release.set()
+        tasks.close()
+        self.assertEquals(done, [0, 1])
+        self.assertEquals(tasks.dropped.count, 1)
+
+    def test_drop_oldest(self):
+        tasks, release = self._blocked(overflow='dropOldest')
+        done = []
+        for i in range(3):
+            tasks.submit(done.append, i)
+        release.set()
+        tasks.close()
+        self.assertEquals(done, [1, 2])
+
+    def test_block(self):
+        tasks, release = self._blocked(block_timeout=0.01)
+        tasks.submit(gevent.sleep, 0)
+        tasks.submit(gevent.sleep, 0)
+        self.assertRaises(QueueFull, tasks.submit, gevent.sleep, 0)
+        release.set()
+        tasks.close()
+        self.assertRaises(QueueFull, tasks.submit, gevent.sleep, 0)
+
+    def test_retries(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise IOError("try again")
+
+        tasks = TaskQueue(retries=2, retry_delay=0.001)
+        tasks.submit(flaky)
+        tasks.close()
+        self.assertEquals(len(attempts), 3)
+        self.assertEquals(tasks.retried.count, 2)
+        self.assertEquals(tasks.failed.count, 0)
+
+    def test_timeout_doesnt_kill_worker(self):
+        def slow():
+            with gevent.Timeout(0.001):
+                gevent.sleep(1)
+
+        tasks = TaskQueue(concurrency=1)
+        done = []
+        tasks.submit(slow)
+        tasks.submit(done.append, 1)
+        tasks.close()
+        self.assertEquals(done, [1])
+        self.assertEquals(tasks.failed.count, 1)
+
+    def test_interrupt_propagates(self):
+        def interrupted():
+            raise KeyboardInterrupt()
+
+        tasks = TaskQueue(retries=2, retry_delay=0.001)
+        self.assertRaises(KeyboardInterrupt, tasks._run, interrupted, (), {})
+        self.assertEquals(tasks.retried.count, 0)
+
+    def test_replaces_dead_workers(self):
+        tasks = TaskQueue(concurrency=2)
+        tasks.start()
+        gevent.killall(tasks._workers)
+        done = []
+        tasks.submit(done.append, 1)
+        self.assertEquals(len([w for w in tasks._workers if not w.dead]), 2)
+        tasks.close()
+        self.assertEquals(done, [1])
+
+    def test_metrics(self):
+        tasks = TaskQueue()
+        registry = MetricsRegistry()
+        tasks.register_metrics(registry, "audit")
+        tasks.submit(gevent.sleep, 0)
+        self.assertEquals(registry.get("droppy.tasks.submitted",
+                                       queue="audit").value(), 1)
+        self.assertEquals(registry.get("droppy.tasks.depth",
+                                       queue="audit").value(), 1)
+        tasks.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
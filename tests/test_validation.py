@@ -15,8 +15,12 @@
 ##  limitations under the License.
 ##
 ###############################################################################
+import json
 import unittest
+from cStringIO import StringIO
 
+import yaml
+import bottle
 from formencode import Invalid
 
 from droppy.validation.validators import NotEmpty, Int, ConfirmType, Constant
@@ -27,6 +31,9 @@ from droppy.validation.validators import MinLength, Regex, PlainText, Email
 from droppy.validation.validators import IndexListConverter, URL, IPAddress
 from droppy.validation.validators import CIDR, MACAddress
 from droppy.validation.properties import ParsedDocument, ParsedProperty
+from droppy.validation.properties import _plan_for, get_defaults
+from droppy.validation.body import validate_body
+from droppy.validation.parsing import parse
 
 
 class TestParsing(unittest.TestCase):
@@ -233,6 +240,197 @@ class TestParsing(unittest.TestCase):
 
 
 
+class TestParse(unittest.TestCase):
+
+    def test_json(self):
+        self.assertEquals(parse('{"a": [1, 2]}'), {'a': [1, 2]})
+        self.assertEquals(parse(StringIO('  {"a": 1}')), {'a': 1})
+
+    def test_yaml_flow_mapping(self):
+        self.assertEquals(parse('{a: 1}'), {'a': 1})
+
+    def test_yaml_stream(self):
+        doc = "first: 1\n" + "".join("key%d: %d\n" % (i, i)
+                                      for i in xrange(2000))
+        result = parse(StringIO(doc))
+        self.assertEquals(result['first'], 1)
+        self.assertEquals(result['key1999'], 1999)
+
+    def test_empty(self):
+        self.assertEquals(parse(""), None)
+        self.assertEquals(parse(StringIO("")), None)
+
+    def test_safe(self):
+        self.assertRaises(yaml.YAMLError, parse,
+                          "!!python/object/apply:os.getcwd []")
+
+
+class TestValidationPlan(unittest.TestCase):
+
+    def _docs(self):
+        class PortDoc(ParsedDocument):
+            @Int()
+            def port(self):
+                return 0
+
+        class HttpDoc(ParsedDocument):
+            @ParsedProperty
+            def http(self):
+                return PortDoc()
+
+        return PortDoc, HttpDoc
+
+    def test_compiled_once_per_class(self):
+        PortDoc, HttpDoc = self._docs()
+
+        class SubDoc(PortDoc):
+            @Int()
+            def timeout(self):
+                return 5
+
+        self.assertTrue(_plan_for(HttpDoc) is _plan_for(HttpDoc))
+        self.assertTrue(_plan_for(SubDoc) is not _plan_for(PortDoc))
+        self.assertEquals(SubDoc.load("").timeout, 5)
+        self.assertFalse(hasattr(PortDoc.load(""), 'timeout'))
+
+    def test_nested_documents_not_shared(self):
+        PortDoc, HttpDoc = self._docs()
+        first = HttpDoc.load({'http': {'port': 8080}})
+        second = HttpDoc.load("")
+        self.assertEquals(first.http.port, 8080)
+        self.assertEquals(second.http.port, 0)
+        self.assertTrue(isinstance(second.http, PortDoc))
+
+    def test_errors_collected(self):
+        PortDoc, HttpDoc = self._docs()
+        try:
+            HttpDoc.load({'http': {'port': 'abc'}})
+        except Invalid as e:
+            self.assertTrue('port' in e.unpack_errors()['http'])
+        else:
+            self.fail("Invalid not raised")
+
+    def test_load_many(self):
+        PortDoc, HttpDoc = self._docs()
+        items = [{'http': {'port': 1}}, {'http': {'port': 'x'}}, {}]
+        results = list(HttpDoc.load_many(items))
+        self.assertEquals([i for i, doc, error in results], [0, 1, 2])
+        self.assertEquals(results[0][1].http.port, 1)
+        self.assertTrue(results[1][1] is None)
+        self.assertTrue(isinstance(results[1][2], Invalid))
+        self.assertEquals(results[2][1].http.port, 0)
+        self.assertTrue(results[2][2] is None)
+
+    def test_load_many_columnar(self):
+        PortDoc, HttpDoc = self._docs()
+        items = [{'http': {'port': 1}}, {'http': {'port': 'x'}}, {}]
+        columns, errors = HttpDoc.load_many(items, columnar=True)
+        self.assertEquals(columns, {'http.port': [1, 0]})
+        self.assertEquals(errors.keys(), [1])
+
+    def test_load_many_columnar_keeps_dict_values(self):
+        class TagDoc(ParsedDocument):
+            @ParsedProperty
+            def tags(self):
+                return {}
+
+        items = [{'tags': {'a': 1}}, {}]
+        columns, errors = TagDoc.load_many(items, columnar=True)
+        self.assertEquals(columns, {'tags': [{'a': 1}, {}]})
+        self.assertEquals(errors, {})
+
+
+class TestLazyDefaults(unittest.TestCase):
+
+    def test_defaults_computed_on_first_use(self):
+        calls = []
+
+        class PortDoc(ParsedDocument):
+            @Int()
+            def port(self):
+                calls.append('port')
+                return 0
+
+        class HttpDoc(ParsedDocument):
+            @ParsedProperty
+            def http(self):
+                calls.append('http')
+                return PortDoc()
+
+        self.assertEquals(calls, [])
+        self.assertEquals(HttpDoc.load("").http.port, 0)
+        self.assertEquals(sorted(calls), ['http', 'port'])
+        HttpDoc.load("")
+        HttpDoc.load({'http': {'port': 1}})
+        self.assertEquals(sorted(calls), ['http', 'port'])
+
+    def test_get_defaults(self):
+        class PortDoc(ParsedDocument):
+            @Int()
+            def port(self):
+                return 80
+
+        class HttpDoc(ParsedDocument):
+            @ParsedProperty
+            def http(self):
+                return PortDoc()
+
+        self.assertEquals(get_defaults(HttpDoc), {'http': {'port': 80}})
+        get_defaults(HttpDoc)['http']['port'] = 1
+        self.assertEquals(get_defaults(HttpDoc), {'http': {'port': 80}})
+
+
+class TestValidateBody(unittest.TestCase):
+
+    class ItemDoc(ParsedDocument):
+        @String()
+        def name(self):
+            return ParsedDocument.NoDefault
+
+        @Int()
+        def quantity(self):
+            return 1
+
+    def _request(self, body):
+        bottle.request.bind({'REQUEST_METHOD': 'POST',
+                             'CONTENT_LENGTH': str(len(body)),
+                             'wsgi.input': StringIO(body)})
+
+    def _handler(self):
+        @validate_body(self.ItemDoc, argument='item')
+        def handler(id, item):
+            return id, item
+        return handler
+
+    def test_valid(self):
+        self._request('{"name": "widget"}')
+        id, item = self._handler()(id="7")
+        self.assertEquals(id, "7")
+        self.assertTrue(isinstance(item, self.ItemDoc))
+        self.assertEquals(item.name, "widget")
+        self.assertEquals(item.quantity, 1)
+
+    def test_invalid(self):
+        self._request('{"quantity": "many"}')
+        try:
+            self._handler()(id="7")
+        except bottle.HTTPResponse as e:
+            self.assertEquals(e.status_code, 422)
+            errors = json.loads(e.body)['errors']
+            self.assertEquals(sorted(errors), ['name', 'quantity'])
+        else:
+            self.fail("HTTPResponse not raised")
+
+    def test_malformed(self):
+        self._request('{"name": ')
+        try:
+            self._handler()(id="7")
+        except bottle.HTTPResponse as e:
+            self.assertEquals(e.status_code, 400)
+        else:
+            self.fail("HTTPResponse not raised")
+
+
 class TestValidators(unittest.TestCase):
 
     def test_notempty(self):
@@ -787,6 +985,20 @@ class TestValidators(unittest.TestCase):
         """ 
         self.assertRaises(Invalid, TestDoc.load, doc)
 
+    def test_validator_options_not_shared(self):
+        class Bounded(ParsedDocument):
+            @Int(min=10)
+            def low(self):
+                return 10
+
+        class Unbounded(ParsedDocument):
+            @Int()
+            def value(self):
+                return 0
+
+        self.assertRaises(Invalid, Bounded.load, {'low': 1})
+        self.assertEquals(Unbounded.load({'value': 1}).value, 1)
+
 
 if __name__ == "__main__":
     unittest.main()